@@ -1,9 +1,7 @@
 import pandas as pd
-from flair.data import Sentence
-from flair.models import SequenceTagger
 from tqdm import tqdm
-import spacy
-import re
+import model_loader
+import name_redaction
 
 #################################################################################
 # Module to support BioAblationAnalysis notebook
@@ -11,7 +9,23 @@ import re
 
 
 class FlairHelper:
-    tagger = SequenceTagger.load("flair/ner-english-ontonotes-fast")
+    def __init__(self, span_store=None, mode="token", max_words=None):
+        '''
+        Params:
+            span_store: optional `span_store.SpanStore`; bios it holds are redacted without tagging them again
+            mode: "token" (bio rebuilt from flair's tokens) or "char" (original formatting kept)
+            max_words: if given, bios are tagged as sentences of at most this many words (`ner_tagging.split_segments`)
+        '''
+        self.span_store = span_store
+        self.mode = mode
+        self.max_words = max_words
+
+    @property
+    def tagger(self):
+        '''
+        flair/ner-english-ontonotes-fast, loaded on first use
+        '''
+        return model_loader.get_flair_tagger("flair/ner-english-ontonotes-fast")
 
     entities = {
         "ethnicity": {'NORP', 'LANGUAGE'},
@@ -28,15 +42,7 @@ class FlairHelper:
         e.g. Ang Lee --> [Ang Lee, Ang, Lee]
         Brian M. Metcalf --> [Brian M. Metcalf, Brian, M., Metcalf]
         '''
-        name_set = [name]
-        try:
-            components = name.split()
-            for i in components:
-                name_set.append(i)
-            return name_set
-
-        except:
-            return name_set
+        return name_redaction.name_variations(name)
 
     def label_name_as_keyword(self, string, name, keyword):
         '''
@@ -44,62 +50,48 @@ class FlairHelper:
 
         e.g. keyword=PERSON, name_variations={"Ang Lee", "Ang", "Lee"}
         '''
-        # replace entity with specified keyword
-        name_variations = self.get_name_set(name)
-        for var in name_variations:
-            string = string.replace(var, keyword)
-
-        # remove duplicates
-        string = re.sub(r'\b(\w+)\s+\1\b', r'\1', string)
-
-        return string
+        return name_redaction.redact_name(string, name, keyword)
 
     def label_specific_entities(self, string, entities: set = {}):
         '''
-        Replaces specified named entities by looping through bio text in reverse order
+        Replaces specified named entities by their labels
         '''
-        # initialize flair 'Sentence'
-        sentence = Sentence(string)
-        # predict NER tags
-        self.tagger.predict(sentence)
-        # convert flair Sentence to tokenized string
-        tokens = sentence.to_tokenized_string().split(" ")
+        return self.label_specific_entities_many([string], entities)[0]
 
-        for label in reversed(sentence.get_labels()):
-            if label.value in entities:
-                tokens = self.substitute_named_entities(tokens, label)
-
-        return " ".join(tokens)
-
-    def substitute_named_entities(self, tokens, label):
+    def label_specific_entities_many(self, strings, entities: set = {}):
         '''
-        Replaces each named entity with its corresponding label
-
-        ['Hortensia', 'Santoveña'] at position [0:2] is replaced with "PER"
-        ['Two', 'Mules', 'for', 'Sister', 'Sara'] at position [23:28] is replaced with "MISC"
+        label_specific_entities for many bios; bios missing from the span store are tagged together
         '''
-        entity = label.value
-        start, end = self.get_span_position(label)
-        del tokens[start:end]
-        tokens.insert(start, entity)
-        return tokens
-
-    def get_span_position(self, label):
-        '''
-        "Span[0:2]: "Hortensia Santoveña" → PER (0.9905)" --> 0, 2
-        "Span[64:65]: "Mexico" → LOC (0.9998)" --> 64, 65
-        '''
-        span = str(label).split(": ")[0][5:-1]
-        start, end = span.split(":")
-        start, end = int(start), int(end)
-
-        return start, end
+        from span_store import build_span_store
+        strings = list(strings)
+        stores = [self.span_store] if self.span_store is not None else []
+        missing = [string for string in dict.fromkeys(strings) if not any(store.row_of(string) is not None
+                                                                         for store in stores)]
+        if missing:
+            stores.append(build_span_store(missing, self.tagger, max_words=self.max_words))
+        out = []
+        for string in strings:
+            store = next(store for store in stores if store.row_of(string) is not None)
+            out.append(store.redact(store.row_of(string), entities, mode=self.mode))
+        return out
 
     ###### Spacy ############
 
 
 class SpacyHelper:
-    nlp = spacy.load('en_core_web_sm')
+    def __init__(self, parse_store=None):
+        '''
+        Params:
+            parse_store: optional `parse_store.raw_store`; bios it holds are not parsed again
+        '''
+        self.parse_store = parse_store
+
+    @property
+    def nlp(self):
+        '''
+        en_core_web_sm, loaded on first use
+        '''
+        return model_loader.get_spacy('en_core_web_sm')
 
     entities = {
         "ethnicity": {'NORP', 'LANGUAGE'},
@@ -111,11 +103,27 @@ class SpacyHelper:
         "ethnicity+location+people": {'NORP', 'LANGUAGE', 'GPE', 'LOC', 'PERSON'},
     }
 
+    def parse_many(self, strings):
+        '''
+        One Doc per bio, from the parse store if there is one
+        '''
+        if self.parse_store is not None:
+            return self.parse_store.parse_many(strings)
+        return list(self.nlp.pipe(strings))
+
     def label_specific_entities(self, string, entities: set = {}):
         '''
         Relabels specified named entities by looping through bio text in reverse order
         '''
-        doc = self.nlp(string)
+        return self.relabel_doc(self.parse_many([string])[0])
+
+    def label_specific_entities_many(self, strings, entities: set = {}):
+        '''
+        label_specific_entities for many bios, parsed together
+        '''
+        return [self.relabel_doc(doc) for doc in self.parse_many(list(strings))]
+
+    def relabel_doc(self, doc):
         modified_text = ""
         start_pos = 0
 
@@ -139,11 +147,4 @@ class SpacyHelper:
 
         e.g. keyword=PERSON_NAME, entity_variations={"Ang Lee", "Ang", "Lee"}
         '''
-        # replace entity with specified keyword
-        for var in entity_variations:
-            string = string.replace(var, keyword)
-
-        # remove duplicates
-        string = re.sub(r'\b(\w+)\s+\1\b', r'\1', string)
-
-        return string
\ No newline at end of file
+        return name_redaction.redact_variations(string, entity_variations, keyword)
@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+import aiohttp
+import pandas as pd
+from bs4 import BeautifulSoup as BS
+from tqdm import tqdm
+import person_metadata
+from DataCollectionHelper import MyLogger, SaveData
+
+'''
+Concurrent version of person_metadata.main for the full list of people.
+
+One pooled aiohttp session (keep-alive connections) fetches /bio pages with at most
+`concurrency` requests in flight, a token bucket caps the request rate, and 429 / 5xx
+responses or connection errors are retried with exponential backoff (honouring
+Retry-After). Pages are parsed with person_metadata.parse_bio_metadata, so the output
+columns are the same as those of get_bio_metadata.
+
+e.g. python async_scraper.py new_names_to_final_sample.csv new_names_to_final_sample_metadata.csv --rate 8
+     python async_scraper.py people.csv out.csv --base-url http://127.0.0.1:8080   (local stand-in server)
+'''
+
+METADATA_COLUMNS = ["overview", "mini_bio", "family", "trademark", "trivia", "quotes"]
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        '''
+        Params:
+            rate: requests per second on average
+            capacity: largest burst, `rate` (one second worth of requests) if not given
+        '''
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        '''
+        Waits until a request may be sent
+        '''
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_delay(attempt, backoff, retry_after=None):
+    '''
+    Seconds to wait before retry number `attempt` (0-based): Retry-After if the server sent
+    a number of seconds, otherwise exponential backoff with jitter
+    '''
+    if retry_after is not None and retry_after.isdigit():
+        return float(retry_after)
+    return backoff * 2 ** attempt * (0.5 + random.random())
+
+
+async def fetch(session, url, bucket, retries=5, backoff=1.0):
+    '''
+    Returns:
+        status code and text of the last response
+    '''
+    for attempt in range(retries + 1):
+        await bucket.acquire()
+        try:
+            async with session.get(url) as response:
+                if response.status in RETRY_STATUSES and attempt < retries:
+                    delay = retry_delay(attempt, backoff, response.headers.get("Retry-After"))
+                    MyLogger.insert(person_metadata.log_file, f"Response {response.status} {url}, retrying in "
+                                    f"{delay:.1f}s", logging.WARNING)
+                    await asyncio.sleep(delay)
+                    continue
+                return response.status, await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == retries:
+                raise
+            MyLogger.insert(person_metadata.log_file, f"{type(e).__name__} {url}, retrying", logging.WARNING)
+            await asyncio.sleep(retry_delay(attempt, backoff))
+
+
+async def scrape_person(session, bucket, semaphore, person_href, person_name, base_url, retries, backoff):
+    '''
+    Same output as person_metadata.get_bio_metadata, with None for every section if the page fails
+    '''
+    async with semaphore:
+        try:
+            person_id = SaveData.extract_id_from_href(person_href, include_text=False)
+            bio_url = f"{person_metadata.get_person_url(person_id, base_url)}/bio"
+            status, html = await fetch(session, bio_url, bucket, retries=retries, backoff=backoff)
+            MyLogger.insert(person_metadata.log_file, f"Response {status} {person_name} \t {person_id}", logging.INFO)
+            # parsing is CPU bound, keep it off the event loop so other requests keep flowing
+            return await asyncio.to_thread(lambda: person_metadata.parse_bio_metadata(BS(html, 'html.parser')))
+        except Exception as e:
+            print(f"Failed in scrape_person() {person_name} \t {person_href} \t{e}")
+            MyLogger.insert(person_metadata.log_file, f"Failed in scrape_person() {person_name} \t {person_href} \t{e}",
+                            logging.ERROR)
+            return (None,) * len(METADATA_COLUMNS)
+
+
+async def scrape_async(hrefs, names, base_url=None, concurrency=8, rate=4.0, retries=5, backoff=1.0, timeout=30,
+                       progress=True):
+    '''
+    Returns:
+        one (overview, mini_bio, family, trademark, trivia, quotes) tuple per person, in input order
+    '''
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(headers=person_metadata.HEADERS, connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        tasks = [asyncio.create_task(scrape_person(session, bucket, semaphore, href, name, base_url, retries, backoff))
+                 for href, name in zip(hrefs, names)]
+        with tqdm(total=len(tasks), desc="people", disable=not progress) as bar:
+            for task in tasks:
+                task.add_done_callback(lambda _: bar.update())
+            return await asyncio.gather(*tasks)
+
+
+def scrape(df, **kwargs):
+    '''
+    Adds the metadata columns of person_metadata.main to a DataFrame with "href" and "name" columns
+    Params:
+        kwargs: see `scrape_async`
+    '''
+    results = asyncio.run(scrape_async(df["href"], df["name"], **kwargs))
+    df = df.copy()
+    for i, column in enumerate(METADATA_COLUMNS):
+        df[column] = [result[i] for result in results]
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("in_file", nargs="?", default="new_names_to_final_sample.csv")
+    parser.add_argument("out_file", nargs="?", default="new_names_to_final_sample_metadata.csv")
+    parser.add_argument("--base-url", default=person_metadata.BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--rate", type=float, default=4.0, help="requests per second")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30, help="seconds per request")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.in_file)
+    df = scrape(df, base_url=args.base_url, concurrency=args.concurrency, rate=args.rate, retries=args.retries,
+                timeout=args.timeout)
+    df.to_csv(args.out_file, mode="a")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import model_loader
+import inference_backends
+import race_classifier
+from race_classifier import RACES
+
+######################################################################################
+# Local HTTP service around the race classifier.
+#
+# Requests are put on an asyncio queue; a single batching loop waits for up to
+# `max_latency_ms` after the first queued request to gather more, scores everything
+# it collected (up to `max_batch_size` bios) in one `race_classifier.score_batch`
+# call, and answers each request with its own rows.
+#
+#   POST /predict   {"text": "..."} or {"texts": ["...", ...]}
+#   GET  /metrics   queue depth and batch size statistics
+#   GET  /health
+#
+# e.g. python classifier_service.py --port 8080 --max-batch-size 32 --max-latency-ms 20
+######################################################################################
+
+
+class MicroBatcher:
+    def __init__(self, score_fn, max_batch_size=32, max_latency_ms=20):
+        '''
+        Params:
+            score_fn: list of texts --> float32 logits of shape (len(texts), 4); runs in a worker thread
+            max_batch_size: most bios scored together (a larger single request is still scored whole)
+            max_latency_ms: longest a request waits for others to join its batch
+        '''
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.texts = 0
+        self.failed_batches = 0
+
+    async def submit(self, texts):
+        '''
+        Queues `texts` and waits for their logits
+        '''
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def next_batch(self):
+        '''
+        Waits for one request, then gathers more until the batch is full or the latency budget is spent
+        '''
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_latency
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            self.batch_sizes[len(texts)] += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+            try:
+                logits = await loop.run_in_executor(self.executor, self.score_fn, texts)
+            except Exception as e:
+                self.failed_batches += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            start = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(logits[start:start + len(item_texts)])
+                start += len(item_texts)
+
+    def metrics(self):
+        batches = sum(self.batch_sizes.values())
+        return {
+            "queue_depth": self.queue.qsize(),
+            "requests": self.requests,
+            "texts": self.texts,
+            "batches": batches,
+            "failed_batches": self.failed_batches,
+            "mean_batch_size": self.texts / batches if batches else 0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "max_batch_size": self.max_batch_size,
+            "max_latency_ms": self.max_latency * 1000,
+        }
+
+
+async def predict(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body is not valid JSON")
+    texts = None
+    if isinstance(body, dict):
+        # a missing "text" is None, and rejected below like any other non-string
+        texts = body["texts"] if "texts" in body else [body.get("text")]
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise web.HTTPBadRequest(text='Expected {"text": str} or {"texts": [str, ...]}')
+    if not texts:
+        return web.json_response({"predictions": []})
+
+    logits = await request.app["batcher"].submit(texts)
+    predictions = [{"label": int(row.argmax()),
+                    "race": RACES[int(row.argmax())],
+                    "probs": dict(zip(RACES, map(float, probs)))}
+                   for row, probs in zip(logits, race_classifier.softmax(logits))]
+    return web.json_response({"predictions": predictions})
+
+
+async def metrics(request):
+    return web.json_response(request.app["batcher"].metrics())
+
+
+async def health(request):
+    return web.json_response({"status": "ok"})
+
+
+def create_app(model_dir, backend_name="eager", export_dir=None, max_batch_size=32, max_latency_ms=20):
+    tokenizer = model_loader.get_tokenizer(model_dir)
+    model = inference_backends.load_backend(backend_name, model_dir, export_dir)
+
+    def score(texts):
+        return race_classifier.score_batch(texts, tokenizer, model, batch_size=max_batch_size, progress=False)
+
+    app = web.Application()
+    app["batcher"] = MicroBatcher(score, max_batch_size=max_batch_size, max_latency_ms=max_latency_ms)
+
+    async def start_batcher(app):
+        app["batcher_task"] = asyncio.create_task(app["batcher"].run())
+
+    async def stop_batcher(app):
+        app["batcher_task"].cancel()
+        app["batcher"].executor.shutdown(wait=False)
+
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+    app.add_routes([web.post("/predict", predict), web.get("/metrics", metrics), web.get("/health", health)])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--model-dir", default=model_loader.MODEL_DIR)
+    parser.add_argument("--backend", default="eager", choices=["eager", "graph", "int8"])
+    parser.add_argument("--export-dir", default="../model/distilbert-export")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    app = create_app(args.model_dir, args.backend, args.export_dir, args.max_batch_size, args.max_latency_ms)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+from urllib.parse import quote
+import pandas as pd
+
+######################################################################################
+# Column-per-file dataset store (Arrow IPC).
+#
+# A dataset is a directory with one Arrow IPC file per column and a schema.json that
+# records the column order, file names and row count. Adding a column writes one new
+# file and leaves the others untouched, instead of rewriting the whole csv. Reads only
+# open (memory-mapped) the requested columns, so scoring one text column never parses
+# `overview`, `family` or `trivia`. `to_csv` exports the current csv layout for
+# anything that still reads csv files.
+#
+# schema.json also records the size and modification time of the csv the store was
+# imported from (or last exported to). A store whose csv has changed since then is
+# not read, and is not exported over that csv; it is imported again instead.
+#
+# Needs pyarrow (`pip install pyarrow`). Without it, `read_columns` reads the csv and
+# `CsvDataset` offers the same interface over the csv file itself.
+#
+# e.g. python dataset_store.py import ../data/test_sample_metadata.csv ../data/test_sample_metadata
+#      python dataset_store.py export ../data/test_sample_metadata ../data/test_sample_metadata.csv
+######################################################################################
+
+SCHEMA_FILE = "schema.json"
+
+
+def has_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+
+def file_stat(path):
+    '''
+    Size and modification time of a file, to tell whether it changed
+    '''
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class DatasetStore:
+    def __init__(self, path):
+        '''
+        Params:
+            path: directory of the dataset, e.g. ../data/test_sample_metadata_with_ner18; loaded if it exists
+        '''
+        self.path = path
+        self.files = {}
+        self.n_rows = None
+        # csv the store was imported from: path relative to the store, size and mtime_ns
+        self.source = None
+        schema_path = os.path.join(path, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                schema = json.load(f)
+            self.files = dict(zip(schema["columns"], schema["files"]))
+            self.n_rows = schema["n_rows"]
+            self.source = schema.get("source")
+
+    @classmethod
+    def from_csv(cls, path, csv_path):
+        '''
+        Creates (or replaces) the dataset at `path` from a csv file
+        '''
+        store = cls(path)
+        for name in store.columns:
+            store.drop_column(name)
+        store.n_rows = None
+        store.source = {"path": os.path.relpath(csv_path, path), **file_stat(csv_path)}
+        store.write_columns(pd.read_csv(csv_path))
+        return store
+
+    @property
+    def columns(self):
+        return list(self.files)
+
+    def __len__(self):
+        return self.n_rows or 0
+
+    def __contains__(self, column):
+        return column in self.files
+
+    def source_path(self):
+        '''
+        csv the store was imported from, None if that was not recorded
+        '''
+        return os.path.normpath(os.path.join(self.path, self.source["path"])) if self.source else None
+
+    def source_changed(self, csv_path=None):
+        '''
+        True if `csv_path` (by default the csv the store was imported from) exists but is not the version
+        last imported into or exported from the store
+        '''
+        csv_path = csv_path or self.source_path()
+        if csv_path is None or not os.path.exists(csv_path):
+            return False
+        return self.source is None or os.path.abspath(csv_path) != os.path.abspath(self.source_path()) or \
+            {key: self.source[key] for key in ("size", "mtime_ns")} != file_stat(csv_path)
+
+    def write_schema(self):
+        schema = {"columns": list(self.files), "files": list(self.files.values()), "n_rows": self.n_rows,
+                  "source": self.source}
+        with open(os.path.join(self.path, f"{SCHEMA_FILE}.tmp"), "w") as f:
+            json.dump(schema, f)
+        os.replace(os.path.join(self.path, f"{SCHEMA_FILE}.tmp"), os.path.join(self.path, SCHEMA_FILE))
+
+    def write_column(self, name, values):
+        '''
+        Adds `name`, or replaces it in place (keeping its position); other columns are not touched
+        Params:
+            values: Series, array or list with one value per row
+        '''
+        self.write_columns(pd.DataFrame({name: pd.Series(values).reset_index(drop=True)}))
+
+    def write_columns(self, df):
+        '''
+        `write_column` for every column of `df`, in its order
+        '''
+        import pyarrow as pa
+        if self.n_rows is not None and len(df) != self.n_rows:
+            raise ValueError(f"{self.path} has {self.n_rows} rows, got columns of {len(df)}")
+        os.makedirs(self.path, exist_ok=True)
+        for name in df.columns:
+            file_name = self.files.get(name, f"{quote(str(name), safe='')}.arrow")
+            table = pa.Table.from_pandas(df[[name]], preserve_index=False)
+            tmp_path = os.path.join(self.path, f"{file_name}.tmp")
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, os.path.join(self.path, file_name))
+            self.files[name] = file_name
+        self.n_rows = len(df)
+        self.write_schema()
+
+    def drop_column(self, name):
+        os.remove(os.path.join(self.path, self.files.pop(name)))
+        self.write_schema()
+
+    def read_column(self, name):
+        '''
+        One column as a Series, read from its memory-mapped file
+        '''
+        import pyarrow as pa
+        if name not in self.files:
+            raise KeyError(f"{name} is not a column of {self.path}, expected one of {self.columns}")
+        # not closed here: zero-copy columns keep the mapping alive for as long as they need it
+        source = pa.memory_map(os.path.join(self.path, self.files[name]))
+        return pa.ipc.open_file(source).read_all().column(0).to_pandas().rename(name)
+
+    def read(self, columns=None):
+        '''
+        Params:
+            columns: columns to read, in that order (all of them if not given)
+        Returns:
+            DataFrame of only those columns
+        '''
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({name: self.read_column(name) for name in columns}, columns=columns)
+
+    def to_csv(self, csv_path, columns=None):
+        '''
+        Exports the dataset in the csv layout the other scripts read (column order of the dataset).
+        Refuses to overwrite the csv the store was imported from if it changed after the import.
+        '''
+        is_source = self.source is not None and os.path.abspath(csv_path) == os.path.abspath(self.source_path())
+        if is_source and self.source_changed(csv_path):
+            raise ValueError(f"{csv_path} changed after it was imported into {self.path}, not overwriting it; "
+                             f"import it again with `python dataset_store.py import {csv_path} {self.path}`")
+        self.read(columns).to_csv(csv_path, index=False)
+        if is_source:
+            # the csv now holds this version of the store
+            self.source.update(file_stat(csv_path))
+            self.write_schema()
+
+
+class CsvDataset:
+    def __init__(self, path):
+        '''
+        The `DatasetStore` interface over a plain csv file, for when pyarrow is not installed;
+        every read parses the csv and every write rewrites all of it
+        Params:
+            path: csv file, e.g. ../data/test_sample_metadata_with_ner18.csv
+        '''
+        self.path = path
+
+    @property
+    def columns(self):
+        return list(pd.read_csv(self.path, nrows=0).columns)
+
+    def read(self, columns=None):
+        df = pd.read_csv(self.path, usecols=columns)
+        return df if columns is None else df[list(columns)]
+
+    def write_columns(self, df):
+        full = pd.read_csv(self.path)
+        if len(df) != len(full):
+            raise ValueError(f"{self.path} has {len(full)} rows, got columns of {len(df)}")
+        for name in df.columns:
+            full[name] = df[name].to_numpy()
+        full.to_csv(self.path, index=False)
+
+    def to_csv(self, csv_path, columns=None):
+        if os.path.abspath(csv_path) != os.path.abspath(self.path) or columns is not None:
+            self.read(columns).to_csv(csv_path, index=False)
+
+
+def read_columns(file_path, columns=None):
+    '''
+    `columns` of a csv file, read from its dataset store (same path without .csv) when there is one
+    e.g. ../data/test_sample_metadata.csv --> ../data/test_sample_metadata/schema.json
+    Raises ValueError if the csv changed after it was imported into the store
+    '''
+    store_path = os.path.splitext(file_path)[0]
+    if os.path.exists(os.path.join(store_path, SCHEMA_FILE)) and not has_pyarrow():
+        print(f"pyarrow is not installed, reading {file_path} instead of {store_path}")
+    elif os.path.exists(os.path.join(store_path, SCHEMA_FILE)):
+        store = DatasetStore(store_path)
+        if store.source_changed(file_path):
+            raise ValueError(f"{file_path} changed after it was imported into {store_path}; import it again with "
+                             f"`python dataset_store.py import {file_path} {store_path}`")
+        return store.read(columns)
+    return pd.read_csv(file_path, usecols=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_command = commands.add_parser("import", help="create a dataset store from a csv file")
+    import_command.add_argument("csv_path")
+    import_command.add_argument("store_path")
+    export_command = commands.add_parser("export", help="write a dataset store back to a csv file")
+    export_command.add_argument("store_path")
+    export_command.add_argument("csv_path")
+    export_command.add_argument("--columns", nargs="+", default=None)
+    args = parser.parse_args()
+    if not has_pyarrow():
+        parser.error("dataset stores need pyarrow (pip install pyarrow)")
+
+    if args.command == "import":
+        store = DatasetStore.from_csv(args.store_path, args.csv_path)
+        print(f"Imported {len(store)} rows, {len(store.columns)} columns into {args.store_path}")
+    else:
+        DatasetStore(args.store_path).to_csv(args.csv_path, columns=args.columns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import os
+from collections import Counter
+import numpy as np
+from span_store import SpanStore, pack_strings, unpack_strings
+
+######################################################################################
+# Per-bio inventory of the entities in a span store.
+#
+# For each bio: the number of spans of every OntoNotes label (a dense bios x labels
+# count matrix) and the surface form of each span. An inverted index maps every
+# (label, surface form) pair to the sorted ids of the bios containing it. Bio ids are
+# the rows of the span store. Breakdown questions ("bios with NORP but no PERSON", how
+# many bios have names, locations and ethnicity terms) are answered from the counts
+# and the index, without scanning bio text again.
+#
+# e.g. python entity_inventory.py ../data/test_sample_metadata_with_ner18_spans.npz
+######################################################################################
+
+# entity groups of the ablation study, as in named_entity_cleaner.entities
+GROUPS = {
+    "ethn": {'NORP', 'LANGUAGE'},
+    "loc": {'GPE', 'LOC'},
+    "ppl": {'PERSON'},
+}
+
+
+class EntityInventory:
+    def __init__(self, labels, counts, surfaces, span_rows, span_labels, span_surfaces):
+        '''
+        Use `from_span_store` or `load` rather than calling this directly
+        Params:
+            labels: entity label names, e.g. ["GPE", "NORP", "PERSON"]
+            counts: int32 (n_bios, n_labels) number of spans of each label in each bio
+            surfaces: distinct surface forms, e.g. ["Ang Lee", "Taiwan", "Chinese"]
+            span_rows, span_labels, span_surfaces: bio id, label index and surface index of every span,
+                                                   sorted by bio id
+        '''
+        self.labels = list(labels)
+        self.label_codes = {label: code for code, label in enumerate(self.labels)}
+        self.counts = np.asarray(counts, dtype=np.int32)
+        self.surfaces = list(surfaces)
+        self.surface_codes = {surface: code for code, surface in enumerate(self.surfaces)}
+        self.span_rows = np.asarray(span_rows, dtype=np.int64)
+        self.span_labels = np.asarray(span_labels, dtype=np.int32)
+        self.span_surfaces = np.asarray(span_surfaces, dtype=np.int64)
+        self.span_bounds = np.searchsorted(self.span_rows, np.arange(len(self) + 1))
+        self.index_keys, self.index_bounds, self.postings = self.build_index()
+
+    @classmethod
+    def from_span_store(cls, store):
+        '''
+        Surface forms are the bio's own characters under each span (flair's tokens joined by
+        spaces for rows whose offsets could not be aligned to the bio)
+        '''
+        n_spans = np.diff(store.span_bounds)
+        span_rows = np.repeat(np.arange(len(store)), n_spans)
+        surface_codes = {}
+        span_surfaces = []
+        for row in range(len(store)):
+            for start, end, char_start, char_end, _, _ in store.row_spans(row):
+                if store.aligned[row]:
+                    surface = store.texts[row][char_start:char_end]
+                else:
+                    surface = " ".join(store.row_tokens(row)[start:end])
+                span_surfaces.append(surface_codes.setdefault(surface, len(surface_codes)))
+        counts = np.zeros((len(store), len(store.labels)), dtype=np.int32)
+        np.add.at(counts, (span_rows, store.span_labels), 1)
+        return cls(store.labels, counts, list(surface_codes), span_rows, store.span_labels, span_surfaces)
+
+    def build_index(self):
+        '''
+        Returns:
+            index_keys: sorted label index * n_surfaces + surface index of every (label, surface) pair
+            index_bounds: pair i is in bios postings[index_bounds[i]:index_bounds[i + 1]]
+            postings: bio ids, sorted within each pair
+        '''
+        n_bios = max(len(self), 1)
+        keys = self.span_labels.astype(np.int64) * len(self.surfaces) + self.span_surfaces
+        pairs = np.unique(keys * n_bios + self.span_rows)
+        pair_keys = pairs // n_bios
+        index_keys, starts = np.unique(pair_keys, return_index=True)
+        return index_keys, np.append(starts, len(pairs)), pairs % n_bios
+
+    def __len__(self):
+        return len(self.counts)
+
+    def save(self, path):
+        '''
+        e.g. ../data/test_sample_metadata_with_ner18_inventory.npz
+        '''
+        surface_data, surface_offsets = pack_strings(self.surfaces)
+        np.savez_compressed(path, labels=np.asarray(self.labels, dtype=str), counts=self.counts,
+                            surface_data=surface_data, surface_offsets=surface_offsets, span_rows=self.span_rows,
+                            span_labels=self.span_labels, span_surfaces=self.span_surfaces)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls([str(label) for label in data["labels"]], data["counts"],
+                       unpack_strings(data["surface_data"], data["surface_offsets"]),
+                       data["span_rows"], data["span_labels"], data["span_surfaces"])
+
+    def has_any(self, labels):
+        '''
+        Boolean mask of the bios with at least one span of any of `labels`
+        '''
+        codes = [self.label_codes[label] for label in labels if label in self.label_codes]
+        return self.counts[:, codes].any(axis=1)
+
+    def select(self, include=(), exclude=()):
+        '''
+        Params:
+            include: label sets a bio must each have a span of, e.g. [{"NORP", "LANGUAGE"}, {"PERSON"}]
+            exclude: labels a bio must have no span of
+        Returns:
+            sorted bio ids
+
+        e.g. select(include=[{"NORP"}], exclude={"PERSON"}) --> bios with NORP but no PERSON
+        '''
+        mask = ~self.has_any(exclude)
+        for labels in include:
+            mask &= self.has_any(labels)
+        return np.flatnonzero(mask)
+
+    def bios_with(self, label, surface):
+        '''
+        Sorted ids of the bios with a `label` span reading exactly `surface`, e.g. ("NORP", "Chinese")
+        '''
+        if label not in self.label_codes or surface not in self.surface_codes:
+            return np.zeros(0, dtype=np.int64)
+        key = self.label_codes[label] * len(self.surfaces) + self.surface_codes[surface]
+        i = np.searchsorted(self.index_keys, key)
+        if i == len(self.index_keys) or self.index_keys[i] != key:
+            return np.zeros(0, dtype=np.int64)
+        return self.postings[self.index_bounds[i]:self.index_bounds[i + 1]]
+
+    def surface_forms(self, row, label=None):
+        '''
+        Counter of the surface forms of a bio's spans, of one label or of all of them
+        '''
+        first, last = self.span_bounds[row], self.span_bounds[row + 1]
+        code = self.label_codes.get(label, -1) if label is not None else None
+        return Counter(self.surfaces[surface] for surface, span_label in
+                       zip(self.span_surfaces[first:last].tolist(), self.span_labels[first:last].tolist())
+                       if code is None or span_label == code)
+
+    def label_surfaces(self, label):
+        '''
+        Counter of the number of bios each surface form of `label` appears in
+        '''
+        if label not in self.label_codes:
+            return Counter()
+        code = self.label_codes[label]
+        label_keys = slice(*np.searchsorted(self.index_keys, [code * len(self.surfaces),
+                                                               (code + 1) * len(self.surfaces)]))
+        bio_counts = np.diff(self.index_bounds)[label_keys]
+        return Counter({self.surfaces[key % len(self.surfaces)]: int(count)
+                        for key, count in zip(self.index_keys[label_keys].tolist(), bio_counts.tolist())})
+
+    def breakdown(self, groups=GROUPS):
+        '''
+        Number of bios by exactly which entity groups they contain
+        Returns:
+            {"ethn_loc_ppl": n, "ethn_loc": n, ..., "ppl_only": n, "none": n}
+        '''
+        names = list(groups)
+        present = np.stack([self.has_any(groups[name]) for name in names], axis=1) if names else \
+            np.zeros((len(self), 0), dtype=bool)
+        combinations = present.astype(np.int64) @ (1 << np.arange(len(names), dtype=np.int64))
+        counts = np.bincount(combinations, minlength=1 << len(names))
+        out = {}
+        for combination in sorted(range(len(counts)), key=lambda c: (-bin(c).count("1"), c)):
+            members = [name for bit, name in enumerate(names) if combination >> bit & 1]
+            key = "_".join(members) if len(members) > 1 else f"{members[0]}_only" if members else "none"
+            out[key] = int(counts[combination])
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spans_path", help="span store, e.g. ../data/test_sample_metadata_with_ner18_spans.npz")
+    parser.add_argument("--out", default=None, help="inventory file, next to the span store if not given")
+    args = parser.parse_args()
+
+    inventory = EntityInventory.from_span_store(SpanStore.load(args.spans_path))
+    base = args.spans_path[:-len("_spans.npz")] if args.spans_path.endswith("_spans.npz") else \
+        os.path.splitext(args.spans_path)[0]
+    inventory.save(args.out or f"{base}_inventory.npz")
+    print(f"{len(inventory)} bios, {len(inventory.span_rows)} entities, {len(inventory.surfaces)} surface forms")
+    for key, count in inventory.breakdown().items():
+        print(key, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+######################################################################################
+# Linear-time substitution of named entities by their labels.
+#
+# Spans are structured offsets (from `ner_tagging.sentence_record`), not parsed out of
+# str(label), and a bio is rewritten in one pass over its sorted spans:
+#   token mode   tokens joined by single spaces; same output as the former del/insert
+#                substitution on `sentence.to_tokenized_string()`
+#   char mode    slices of the original bio between the spans, so its spacing, line
+#                breaks and punctuation are kept
+# `substitute_variants` builds every requested entity-set variant of a bio in that
+# same pass.
+######################################################################################
+
+
+def align_offsets(text, tokens, token_offsets):
+    '''
+    Character offsets of `tokens` in `text`. Flair's offsets are kept where they point
+    at the token, otherwise the token is searched for after the previous one.
+    Returns:
+        list of (start, end), or None if some token does not occur in `text`
+    '''
+    aligned = []
+    cursor = 0
+    for token, (start, end) in zip(tokens, token_offsets):
+        if start < cursor or text[start:end] != token:
+            start = text.find(token, cursor)
+            if start < 0:
+                return None
+            end = start + len(token)
+        aligned.append((start, end))
+        cursor = end
+    return aligned
+
+
+def substitute_variants(spans, entity_sets, tokens=None, text=None):
+    '''
+    Params:
+        spans: (start, end, label) sorted by start; token indices in token mode, character
+               offsets in char mode
+        entity_sets: labels to replace for each variant, None to replace every label
+        tokens: the bio's tokens, for token mode
+        text: the original bio, for char mode
+    Returns:
+        one redacted bio per entity set
+
+    e.g. spans=[(0, 2, "PERSON"), (5, 6, "GPE")], entity_sets=[{"GPE"}, None],
+         tokens="Ang Lee was born in Taiwan .".split()
+         --> ["Ang Lee was born in GPE .", "PERSON was born in GPE ."]
+    '''
+    char_mode = text is not None
+    outs = [[] for _ in entity_sets]
+    positions = [0] * len(entity_sets)
+    for start, end, label in spans:
+        for i, entities in enumerate(entity_sets):
+            if (entities is not None and label not in entities) or start < positions[i]:
+                continue
+            if char_mode:
+                outs[i].append(text[positions[i]:start])
+            else:
+                outs[i].extend(tokens[positions[i]:start])
+            outs[i].append(label)
+            positions[i] = end
+
+    if char_mode:
+        return ["".join(out) + text[position:] for out, position in zip(outs, positions)]
+    return [" ".join(out + tokens[position:]) for out, position in zip(outs, positions)]
+
+
+def substitute(spans, entities=None, tokens=None, text=None):
+    '''
+    `substitute_variants` for a single entity set
+    '''
+    return substitute_variants(spans, [entities], tokens=tokens, text=text)[0]
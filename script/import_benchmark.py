@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+######################################################################################
+# Cold-start benchmark for the script modules.
+#
+# Every measurement runs in a fresh interpreter so nothing is shared between runs:
+#   import    time to `import <module>`
+#   first use time for the first model request after import (see model_loader.py)
+#
+# e.g. python import_benchmark.py --repeat 5 --first-use
+######################################################################################
+
+MODULES = ["text_preprocessing", "race_classifier", "score_store", "prediction_cache", "preprocess_cache",
+           "parse_store", "ner_tagging", "span_store", "entity_inventory", "dataset_store", "tokenized_corpus",
+           "model_loader", "named_entity_tester", "named_entity_cleaner", "name_redaction", "BiographyAblation"]
+
+FIRST_USE = {
+    "classifier": "model_loader.get_tokenizer(); model_loader.get_classifier()",
+    "spacy": "model_loader.get_spacy()",
+    "flair": "model_loader.get_flair_tagger()",
+}
+
+TIMER = '''
+import json, time
+t = time.perf_counter()
+{setup}
+setup_time = time.perf_counter() - t
+t = time.perf_counter()
+{statement}
+print(json.dumps({{"setup": setup_time, "seconds": time.perf_counter() - t}}))
+'''
+
+
+def time_in_fresh_interpreter(statement, setup="pass"):
+    '''
+    Returns:
+        seconds taken by `statement` in a new python process (after `setup`)
+    '''
+    code = TIMER.format(setup=setup, statement=statement)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])["seconds"]
+
+
+def benchmark(names, statement_for, setup_for, repeat):
+    results = {}
+    for name in names:
+        try:
+            times = [time_in_fresh_interpreter(statement_for(name), setup_for(name)) for _ in range(repeat)]
+            results[name] = {"median": statistics.median(times), "min": min(times), "max": max(times)}
+            print(f"{name:<24}{results[name]['median']:>10.3f}s (min {results[name]['min']:.3f}s, max {results[name]['max']:.3f}s)")
+        except RuntimeError as e:
+            results[name] = {"error": str(e)}
+            print(f"{name:<24}{'failed':>10}  {e}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--first-use", action="store_true", help="also time the first load of each model")
+    parser.add_argument("--out", help="write results as json to this file")
+    args = parser.parse_args()
+
+    print("IMPORT TIME")
+    results = {"import": benchmark(MODULES, lambda m: f"import {m}", lambda m: "pass", args.repeat)}
+    if args.first_use:
+        print("FIRST USE")
+        results["first_use"] = benchmark(FIRST_USE, FIRST_USE.get, lambda m: "import model_loader", args.repeat)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
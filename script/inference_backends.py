@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+######################################################################################
+# Selectable CPU inference backends for the race classifier.
+#
+#   eager   the Keras model called directly (baseline, FP32)
+#   graph   traced tf.function graphs with fixed (batch, length) signatures, FP32
+#   int8    the traced graphs converted to TFLite with dynamic range int8 quantization
+#
+# Every backend takes padded int32 (input_ids, attention_mask) and returns logits, so
+# `race_classifier.score_ids` can run any of them. Fixed-shape backends pad each batch
+# up to the next exported length.
+#
+# e.g. python inference_backends.py export ../model/distilbert ../model/distilbert-export
+#      python inference_backends.py parity ../model/distilbert ../model/distilbert-export int8
+######################################################################################
+
+LENGTHS = (64, 128, 256, 512)
+EXPORT_MANIFEST = "export.json"
+
+
+class EagerBackend:
+    name = "eager"
+    batch_size = None
+
+    def __init__(self, model):
+        self.model = model
+
+    def padded_shape(self, rows, longest):
+        return rows, longest
+
+    def __call__(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits.numpy()
+
+
+class FixedShapeBackend:
+    '''
+    Shared padding rules for backends exported with fixed (batch_size, length) inputs
+    '''
+    def __init__(self, export_dir):
+        with open(os.path.join(export_dir, EXPORT_MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.batch_size = self.manifest["batch_size"]
+        self.lengths = sorted(self.manifest["lengths"])
+
+    def padded_shape(self, rows, longest):
+        '''
+        e.g. rows=20, longest=90 --> (32, 128) for batch_size=32, lengths=(64, 128, 256, 512)
+        '''
+        if rows > self.batch_size:
+            raise ValueError(f"Batch of {rows} rows is larger than the exported batch size {self.batch_size}")
+        for length in self.lengths:
+            if longest <= length:
+                return self.batch_size, length
+        raise ValueError(f"Sequence of {longest} tokens is longer than the longest exported length {self.lengths[-1]}")
+
+
+class GraphBackend(FixedShapeBackend):
+    name = "graph"
+
+    def __init__(self, export_dir):
+        import tensorflow as tf
+        super().__init__(export_dir)
+        self.loaded = tf.saved_model.load(os.path.join(export_dir, "graph"))
+        self.functions = {length: self.loaded.signatures[f"serving_{length}"] for length in self.lengths}
+
+    def __call__(self, input_ids, attention_mask):
+        import tensorflow as tf
+        function = self.functions[input_ids.shape[1]]
+        return function(input_ids=tf.constant(input_ids), attention_mask=tf.constant(attention_mask))["logits"].numpy()
+
+
+class TFLiteBackend(FixedShapeBackend):
+    name = "int8"
+
+    def __init__(self, export_dir, num_threads=None):
+        import tensorflow as tf
+        super().__init__(export_dir)
+        self.interpreters = {}
+        for length in self.lengths:
+            interpreter = tf.lite.Interpreter(model_path=os.path.join(export_dir, "int8", f"model_{length}.tflite"),
+                                              num_threads=num_threads or os.cpu_count())
+            interpreter.allocate_tensors()
+            self.interpreters[length] = interpreter
+
+    def __call__(self, input_ids, attention_mask):
+        interpreter = self.interpreters[input_ids.shape[1]]
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        for detail in interpreter.get_input_details():
+            name = "attention_mask" if "attention_mask" in detail["name"] else "input_ids"
+            interpreter.set_tensor(detail["index"], inputs[name].astype(detail["dtype"]))
+        interpreter.invoke()
+        return interpreter.get_tensor(interpreter.get_output_details()[0]["index"]).copy()
+
+
+def export_graph(model, export_dir, batch_size=32, lengths=LENGTHS):
+    '''
+    Traces `model` once per length in `lengths` with a fixed batch size and saves
+    all signatures (serving_64, serving_128, ...) as one SavedModel in export_dir/graph
+    '''
+    import tensorflow as tf
+
+    def serving_for(length):
+        @tf.function(input_signature=[tf.TensorSpec((batch_size, length), tf.int32, name="input_ids"),
+                                      tf.TensorSpec((batch_size, length), tf.int32, name="attention_mask")])
+        def serving(input_ids, attention_mask):
+            return {"logits": model(input_ids=input_ids, attention_mask=attention_mask, training=False).logits}
+        return serving
+
+    module = tf.Module()
+    module.model = model
+    signatures = {f"serving_{length}": serving_for(length).get_concrete_function() for length in lengths}
+    tf.saved_model.save(module, os.path.join(export_dir, "graph"), signatures=signatures)
+    with open(os.path.join(export_dir, EXPORT_MANIFEST), "w") as f:
+        json.dump({"batch_size": batch_size, "lengths": list(lengths)}, f, indent=2)
+
+
+def export_int8(export_dir):
+    '''
+    Converts every traced signature in export_dir/graph to a dynamically quantized
+    (int8 weights, float activations) TFLite model in export_dir/int8
+    '''
+    import tensorflow as tf
+    with open(os.path.join(export_dir, EXPORT_MANIFEST)) as f:
+        lengths = json.load(f)["lengths"]
+    os.makedirs(os.path.join(export_dir, "int8"), exist_ok=True)
+    for length in lengths:
+        converter = tf.lite.TFLiteConverter.from_saved_model(os.path.join(export_dir, "graph"),
+                                                             signature_keys=[f"serving_{length}"])
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        with open(os.path.join(export_dir, "int8", f"model_{length}.tflite"), "wb") as f:
+            f.write(converter.convert())
+
+
+def load_backend(name, model_dir, export_dir=None):
+    '''
+    Params:
+        name: "eager", "graph" or "int8"
+        export_dir: output of `export_graph` / `export_int8` (only needed for graph and int8)
+    '''
+    import model_loader
+    if name == "eager":
+        return EagerBackend(model_loader.get_classifier(model_dir))
+    if name == "graph":
+        return model_loader.load_once(("graph", export_dir), lambda: GraphBackend(export_dir))
+    if name == "int8":
+        return model_loader.load_once(("int8", export_dir), lambda: TFLiteBackend(export_dir))
+    raise ValueError(f"Unknown backend {name}, expected one of eager, graph, int8")
+
+
+def backend_weights_dirs(name, model_dir, export_dir=None):
+    '''
+    Directories holding the weights a backend actually runs and the tokenizer feeding it
+    (used to fingerprint prediction caches); graph and int8 still tokenize with `model_dir`
+    '''
+    return (model_dir,) if name == "eager" else (model_dir, os.path.join(export_dir, name))
+
+
+def parity_report(texts, labels, baseline, candidate, tokenizer, batch_size=32):
+    '''
+    Per-race precision and recall of `candidate` next to the FP32 `baseline`
+    Params:
+        texts: Series or list of raw biography text
+        labels: true race labels {0, 1, 2, 3}
+    Returns:
+        DataFrame with one row per race and the label agreement between both backends
+    '''
+    import race_classifier
+    from sklearn.metrics import precision_recall_fscore_support
+    ids = race_classifier.encode_texts(race_classifier.prepare_texts(texts), tokenizer)
+    predictions = {}
+    for backend in (baseline, candidate):
+        logits = race_classifier.score_ids(ids, backend, tokenizer.pad_token_id, batch_size=batch_size)
+        predictions[backend.name] = logits.argmax(axis=1)
+
+    report = {}
+    for name, pred in predictions.items():
+        precision, recall, _, support = precision_recall_fscore_support(
+            labels, pred, labels=range(len(race_classifier.RACES)), zero_division=0)
+        report[f"{name}_precision"] = precision
+        report[f"{name}_recall"] = recall
+    report = pd.DataFrame(report, index=race_classifier.RACES)
+    report["precision_delta"] = report[f"{candidate.name}_precision"] - report[f"{baseline.name}_precision"]
+    report["recall_delta"] = report[f"{candidate.name}_recall"] - report[f"{baseline.name}_recall"]
+    report["support"] = support
+    report.attrs["agreement"] = float(np.mean(predictions[baseline.name] == predictions[candidate.name]))
+    return report
+
+
+def main():
+    import model_loader
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="trace the graph backend and quantize the int8 backend")
+    export.add_argument("model_dir")
+    export.add_argument("export_dir")
+    export.add_argument("--batch-size", type=int, default=32)
+    parity = commands.add_parser("parity", help="compare a backend against eager FP32 on the test set")
+    parity.add_argument("model_dir")
+    parity.add_argument("export_dir")
+    parity.add_argument("backend", choices=["graph", "int8"])
+    parity.add_argument("--test-file", default="../data/test_sample_metadata.csv")
+    parity.add_argument("--col-name", default="mini_bio")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_graph(model_loader.get_classifier(args.model_dir), args.export_dir, batch_size=args.batch_size)
+        export_int8(args.export_dir)
+    else:
+        test_df = pd.read_csv(args.test_file, usecols=[args.col_name, "label"]).replace(np.nan, "", regex=True)
+        report = parity_report(test_df[args.col_name], test_df["label"],
+                               load_backend("eager", args.model_dir),
+                               load_backend(args.backend, args.model_dir, args.export_dir),
+                               model_loader.get_tokenizer(args.model_dir))
+        print(report.round(4).to_string())
+        print(f"label agreement with FP32: {report.attrs['agreement']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import race_classifier
+import inference_backends
+import named_entity_tester
+
+######################################################################################
+# Reproducible inference benchmark.
+#
+# Builds a small, randomly initialized DistilBERT stand-in (same architecture and
+# code paths as model/distilbert, just fewer and narrower layers) and a synthetic bio
+# corpus with controlled length buckets, then times the real scoring functions:
+#   score_batch        race_classifier.score_batch, one call per request of `batch_size` bios
+#   predict_race_for   named_entity_tester.predict_race_for on a CSV of the bucket
+# and reports p50/p95/p99 request latency and bios per second for every
+# (path, backend, batch size, length bucket), written to a json file.
+#
+# e.g. python inference_benchmark.py --backends eager graph int8 --out ../data/benchmark.json
+######################################################################################
+
+LENGTH_BUCKETS = {"short": (20, 60), "medium": (100, 200), "long": (300, 450), "over_512": (600, 900)}
+BATCH_SIZES = [1, 8, 32]
+WORDS = ("actor actress born raised city family father mother studied university theater film television "
+         "career began role series award nominated married children moved york los angeles london chicago "
+         "known appeared starred director producer writer singer music band debut season episode character "
+         "comedy drama school high college degree graduated worked years later first lead supporting").split()
+
+
+def build_standin_model(out_dir, seed=0, dim=64, n_layers=2):
+    '''
+    Saves a tiny TFDistilBertForSequenceClassification and a matching tokenizer to `out_dir`
+    '''
+    import tensorflow as tf
+    from transformers import DistilBertConfig, DistilBertTokenizerFast, TFDistilBertForSequenceClassification
+    tf.random.set_seed(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *sorted(set(WORDS))]
+    with open(os.path.join(out_dir, "vocab.txt"), "w") as f:
+        f.write("\n".join(vocab) + "\n")
+    tokenizer = DistilBertTokenizerFast(vocab_file=os.path.join(out_dir, "vocab.txt"), model_max_length=512)
+    config = DistilBertConfig(vocab_size=len(vocab), dim=dim, hidden_dim=dim * 4, n_layers=n_layers, n_heads=2,
+                              num_labels=len(race_classifier.RACES), max_position_embeddings=512)
+    model = TFDistilBertForSequenceClassification(config)
+    model(model.dummy_inputs)
+    tokenizer.save_pretrained(out_dir)
+    model.save_pretrained(out_dir)
+
+
+def synthetic_corpus(n_per_bucket, seed=0):
+    '''
+    Returns:
+        {bucket name: list of bios whose word counts are uniform within the bucket's range}
+    '''
+    rng = np.random.default_rng(seed)
+    corpus = {}
+    for bucket, (low, high) in LENGTH_BUCKETS.items():
+        lengths = rng.integers(low, high + 1, size=n_per_bucket)
+        corpus[bucket] = [" ".join(rng.choice(WORDS, size=length)) for length in lengths]
+    return corpus
+
+
+def summarize(latencies, n_bios):
+    latencies = np.asarray(latencies)
+    return {
+        "requests": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "bios_per_sec": float(n_bios / latencies.sum()),
+    }
+
+
+def bench_score_batch(texts, tokenizer, backend, batch_size, preprocess):
+    '''
+    One `score_batch` call per request of `batch_size` bios (batch_size=1 is the old per-row path)
+    '''
+    race_classifier.score_batch(texts[:batch_size], tokenizer, backend, batch_size=batch_size,
+                                preprocess=preprocess, progress=False)  # warm up
+    latencies = []
+    for start in range(0, len(texts), batch_size):
+        t = time.perf_counter()
+        race_classifier.score_batch(texts[start:start + batch_size], tokenizer, backend, batch_size=batch_size,
+                                    preprocess=preprocess, progress=False)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, len(texts))
+
+
+def bench_predict_race_for(texts, work_dir, bucket, batch_size, repeat):
+    '''
+    End to end: CSV read, preprocessing, scoring and report through named_entity_tester
+    '''
+    file_path = os.path.join(work_dir, f"{bucket}.csv")
+    pd.DataFrame({"name": [f"person {i}" for i in range(len(texts))],
+                  "href": [f"/name/nm{i:07}/" for i in range(len(texts))],
+                  "mini_bio": texts,
+                  "label": np.arange(len(texts)) % len(race_classifier.RACES)}).to_csv(file_path, index=False)
+    latencies = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        named_entity_tester.predict_race_for(file_path, "mini_bio", should_eval=False, batch_size=batch_size)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, len(texts) * repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["eager"], choices=["eager", "graph", "int8"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=BATCH_SIZES)
+    parser.add_argument("--n-per-bucket", type=int, default=64)
+    parser.add_argument("--preprocess", action="store_true", help="include text_preprocessing (needs spaCy)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the end to end predict_race_for path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="inference_benchmark.json")
+    args = parser.parse_args()
+
+    import model_loader
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_dir = os.path.join(work_dir, "standin")
+        export_dir = os.path.join(work_dir, "standin-export")
+        build_standin_model(model_dir, seed=args.seed)
+        tokenizer = model_loader.get_tokenizer(model_dir)
+        if set(args.backends) - {"eager"}:
+            inference_backends.export_graph(model_loader.get_classifier(model_dir), export_dir,
+                                            batch_size=max(args.batch_sizes))
+        if "int8" in args.backends:
+            inference_backends.export_int8(export_dir)
+
+        # point the tester at the stand-in model; no caches, parse store or pre-tokenized corpus, every run
+        # must preprocess and hit the model (and synthetic bios must not end up in the caches under ../data)
+        named_entity_tester.model_dir = model_dir
+        named_entity_tester.export_dir = export_dir
+        named_entity_tester.use_cache = False
+        named_entity_tester.use_preprocess_cache = False
+        named_entity_tester.use_parse_store = False
+        named_entity_tester.use_tokenized_corpus = False
+
+        corpus = synthetic_corpus(args.n_per_bucket, seed=args.seed)
+        results = []
+        for backend_name in args.backends:
+            backend = inference_backends.load_backend(backend_name, model_dir, export_dir)
+            named_entity_tester.backend_name = backend_name
+            for bucket, texts in corpus.items():
+                mean_tokens = float(np.mean([len(ids) for ids in race_classifier.encode_texts(texts, tokenizer)]))
+                for batch_size in args.batch_sizes:
+                    row = {"path": "score_batch", "backend": backend_name, "batch_size": batch_size,
+                           "length_bucket": bucket, "mean_tokens": mean_tokens,
+                           **bench_score_batch(texts, tokenizer, backend, batch_size, args.preprocess)}
+                    results.append(row)
+                    print(f"{row['path']:<17}{backend_name:<7}bs={batch_size:<4}{bucket:<10}"
+                          f"p50={row['p50_ms']:8.1f}ms p95={row['p95_ms']:8.1f}ms p99={row['p99_ms']:8.1f}ms "
+                          f"{row['bios_per_sec']:8.1f} bios/s")
+                if args.preprocess:
+                    # predict_race_for always preprocesses, so it is only comparable with --preprocess
+                    row = {"path": "predict_race_for", "backend": backend_name, "batch_size": max(args.batch_sizes),
+                           "length_bucket": bucket, "mean_tokens": mean_tokens,
+                           **bench_predict_race_for(texts, work_dir, bucket, max(args.batch_sizes), args.repeat)}
+                    results.append(row)
+                    print(f"{row['path']:<17}{backend_name:<7}bs={row['batch_size']:<4}{bucket:<10}"
+                          f"p50={row['p50_ms']:8.1f}ms {row['bios_per_sec']:8.1f} bios/s")
+
+    config = {**vars(args), "length_buckets": LENGTH_BUCKETS, "python": platform.python_version(),
+              "machine": platform.machine(), "cpu_count": os.cpu_count()}
+    with open(args.out, "w") as f:
+        json.dump({"config": config, "results": results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
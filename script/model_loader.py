@@ -0,0 +1,62 @@
+import threading
+
+######################################################################################
+# Process-wide, lazily created model singletons.
+#
+# Nothing heavy (TensorFlow, transformers, Flair, spaCy) is imported until a model is
+# first requested, and each model is loaded at most once per process no matter how
+# many modules ask for it.
+######################################################################################
+
+MODEL_DIR = "../model/distilbert"
+SPACY_MODEL = "en_core_web_sm"
+FLAIR_TAGGER = "flair/ner-english-ontonotes-fast"
+
+_loaded = {}
+# re-entrant, loaders may themselves request other models (e.g. text_preprocessing.get_nlp)
+_lock = threading.RLock()
+
+
+def load_once(key, load):
+    '''
+    Returns the object stored under `key`, calling `load()` to create it on first use
+    '''
+    with _lock:
+        if key not in _loaded:
+            _loaded[key] = load()
+        return _loaded[key]
+
+
+def is_loaded(key):
+    return key in _loaded
+
+
+def get_tokenizer(model_dir=MODEL_DIR):
+    def load():
+        from transformers import DistilBertTokenizerFast
+        return DistilBertTokenizerFast.from_pretrained(model_dir)
+    return load_once(("tokenizer", model_dir), load)
+
+
+def get_classifier(model_dir=MODEL_DIR):
+    def load():
+        from transformers import TFDistilBertForSequenceClassification
+        return TFDistilBertForSequenceClassification.from_pretrained(model_dir)
+    return load_once(("classifier", model_dir), load)
+
+
+def get_spacy(name=SPACY_MODEL):
+    def load():
+        import spacy
+        return spacy.load(name)
+    return load_once(("spacy", name), load)
+
+
+def get_flair_tagger(name=FLAIR_TAGGER):
+    '''
+    e.g. name="flair/ner-english" for the 4 category tagger
+    '''
+    def load():
+        from flair.models import SequenceTagger
+        return SequenceTagger.load(name)
+    return load_once(("flair", name), load)
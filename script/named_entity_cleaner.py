@@ -1,8 +1,9 @@
+import os
 import pandas as pd
-import mapply
-from flair.data import Sentence
-from flair.models import SequenceTagger
-from tqdm import tqdm
+import model_loader
+import ner_tagging
+from dataset_store import CsvDataset, DatasetStore, has_pyarrow
+from span_store import SpanStore
 
 # ######################################################################################
 # # This file is used to remove specific named entities for our ablation study.
@@ -15,23 +16,13 @@ from tqdm import tqdm
 
 ################################### MAIN FUNCTIONS ####################################
 
-def clean_column_to_18_specific_entities(in_col: str, entities: set, reason: str=""):
-    '''
-    Removes NER tags specified by `entities` to redact labels
-    '''
-    if reason:
-        print(f"TASK: Ablate flair entities {entities}.\nREASON: {reason}")
-
-    out_col = in_col.mapply(lambda x: clean_specific_entities(x, entities))
-    
-    return out_col
-
 def clean_to_18():
     '''
     2 ALL ENTITIES (18 CATEGORY MODEL)
     '''
     df = pd.read_csv(f"{main_dir}/data/test_sample_metadata.csv")
-    df["ner_bio"] = df["mini_bio"].mapply(clean_all_entities)
+    spans = get_span_store(df["mini_bio"], f"{main_dir}/data/test_sample_metadata_spans.npz")
+    df["ner_bio"] = spans.redact_all(mode=substitution_mode)
     
     out_file = f"{main_dir}/data/test_sample_metadata_with_ner18.csv"
     df.to_csv(out_file, index=False)
@@ -41,92 +32,100 @@ def clean_to_4():
     1 ALL ENTITIES
     '''
     df = pd.read_csv(f"{main_dir}/data/test_sample_metadata.csv")
-
-    tqdm.pandas(desc="progress bar!")
-    df["ner_bio"] = df["mini_bio"].progress_apply(clean_all_entities)
+    df["ner_bio"] = tag_column(df["mini_bio"]).redact_all(mode=substitution_mode)
     
     out_file = f"{main_dir}/data/test_sample_metadata_with_ner.csv"
     df.to_csv(out_file, index=False)
 
 ################################### HELPER FUNCTIONS ####################################
 
-def clean_specific_entities(string, entities: set = {}):
+def get_tagger():
     '''
-    Removes specified named entities by looping through bio text in reverse order
+    Flair tagger named by `tagger_name`, loaded on first use
     '''
-    # initialize flair 'Sentence'
-    sentence = Sentence(string)
-    # predict NER tags
-    tagger.predict(sentence)
-    # convert flair Sentence to tokenized string
-    tokens = sentence.to_tokenized_string().split(" ")
-
-    # final clean string
-    # clean_string = [substitute_named_entities(tokens, label) for label in reversed(sentence.get_labels()) if label.value in entities][-1] # fails when no entities
+    return model_loader.get_flair_tagger(tagger_name)
 
-    for label in reversed(sentence.get_labels()):
-        if label.value in entities:
-            tokens = substitute_named_entities(tokens, label)    
-
-    return " ".join(tokens)
-
-def clean_all_entities(string):
+def tag_column(in_col):
     '''
-    Removes all named entities (either all 4- or all 18-) by looping through bio text in reverse order, 
-    substituting named entities for labels. 
+    Tags every bio of `in_col` in length-sorted batches of `mini_batch_size`,
+    in `n_workers` processes (one tagger each) if more than one,
+    as segments of at most `max_words` words if set
+    Returns:
+        `span_store.SpanStore` of the results
     '''
-    # initialize flair 'Sentence'
-    sentence = Sentence(string)
-    # predict NER tags
-    tagger.predict(sentence)
-    # convert flair Sentence to tokenized string
-    tokens = sentence.to_tokenized_string().split(" ")
-    # final clean string
-    clean_string = [substitute_named_entities(tokens, label) for label in reversed(sentence.get_labels())][-1] # select final str
-    return " ".join(clean_string)
-
-def substitute_named_entities(tokens, label):
+    texts = ["" if not isinstance(text, str) else text for text in in_col]
+    if n_workers > 1:
+        records = ner_tagging.tag_parallel(texts, tagger_name, n_workers=n_workers, mini_batch_size=mini_batch_size,
+                                           max_words=max_words)
+    else:
+        records = ner_tagging.tag_many(texts, get_tagger(), mini_batch_size=mini_batch_size, max_words=max_words,
+                                       progress=True)
+    return SpanStore.from_records(texts, records)
+
+def get_dataset(file):
     '''
-    Replaces each named entity with its corresponding label
-
-    ['Hortensia', 'Santoveña'] at position [0:2] is replaced with "PER"
-    ['Two', 'Mules', 'for', 'Sister', 'Sara'] at position [23:28] is replaced with "MISC"
+    Dataset store of f"{main_dir}/data/{file}.csv" (see dataset_store.py), imported from the csv on first use
+    and again whenever the csv changed since (e.g. after `clean_to_18()`); the csv itself if pyarrow is missing
+    '''
+    csv_path = f"{main_dir}/data/{file}.csv"
+    if not has_pyarrow():
+        print(f"pyarrow is not installed (pip install pyarrow), reading and rewriting {csv_path} instead of a "
+              f"dataset store")
+        return CsvDataset(csv_path)
+    dataset = DatasetStore(f"{main_dir}/data/{file}")
+    if dataset.columns and dataset.source_changed(csv_path):
+        print(f"{csv_path} changed since it was imported into {dataset.path}, importing it again")
+    elif dataset.columns:
+        return dataset
+    return DatasetStore.from_csv(dataset.path, csv_path)
+
+def get_span_store(in_col, spans_path):
+    '''
+    NER spans of every bio in `in_col`, tagged once and saved to `spans_path`;
+    read back instead of tagged again when the file holds exactly these bios
     '''
-    entity = label.value
-    start, end = get_span_position(label)
-    del tokens[start:end]
-    tokens.insert(start,entity)
-    return tokens
+    texts = ["" if not isinstance(text, str) else text for text in in_col]
+    if os.path.exists(spans_path):
+        spans = SpanStore.load(spans_path)
+        if spans.texts == texts:
+            return spans
+    spans = tag_column(texts)
+    spans.save(spans_path)
+    return spans
 
-def get_span_position(label):
+def clean_specific_entities(string, entities: set = {}):
     '''
-    "Span[0:2]: "Hortensia Santoveña" → PER (0.9905)" --> 0, 2
-    "Span[64:65]: "Mexico" → LOC (0.9998)" --> 64, 65
+    Removes specified named entities, substituting them for their labels in one pass over the bio
     '''
-    span = str(label).split(": ")[0][5:-1]
-    start, end = span.split(":")
-    start, end = int(start), int(end)
+    string = string if isinstance(string, str) else ""
+    spans = SpanStore.from_records([string], ner_tagging.tag_many([string], get_tagger()))
+    return spans.redact(0, entities, mode=substitution_mode)
 
-    return start, end
+def clean_all_entities(string):
+    '''
+    Removes all named entities (either all 4- or all 18-), substituting named entities for labels
+    '''
+    return clean_specific_entities(string, entities=None)
 
 ############################################# DO HERE ###################################################
 
 ### SET UP 
 main_dir = ".."
-mapply.init(n_workers=-1, chunk_size=1, max_chunks_per_worker=10, progressbar=True)
-
-# tagger = SequenceTagger.load("flair/ner-english") # tagger used for 1 ALL ENTITIES
-tagger = SequenceTagger.load("flair/ner-english-ontonotes-fast") # tagger used for 2 ALL ENTITIES (18 CATEGORY)
-
-### Create initial `test_sample_metadata_with_ner` and `test_sample_metadata_with_ner18` ##########
-# 1 All ENTITIES
-# clean_to_4()
-
-# 2 ALL ENTITIES (18 CATEGORY MODEL)
-# clean_to_18()
+# bios per forward pass of the tagger, and tagging processes (each loads its own tagger)
+mini_batch_size = 32
+n_workers = 1
+# tag bios sentence by sentence, cutting sentences longer than this many words (None tags whole bios);
+# bounds sequence length on long bios, but entities are no longer tagged with cross-sentence context
+max_words = None
+# "token" rebuilds bios from flair's tokens (as the existing ablation csvs), "char" keeps the original formatting
+substitution_mode = "token"
+# also rewrite the csv of the dataset store, for readers of the csv files
+export_csv = True
+
+# tagger_name = "flair/ner-english" # tagger used for 1 ALL ENTITIES
+tagger_name = "flair/ner-english-ontonotes-fast" # tagger used for 2 ALL ENTITIES (18 CATEGORY)
 
 ### Cleans specific entities and combinations of entities
-file = "test_sample_metadata_with_ner18"
 entities = {
     "ethnicity": {'NORP', 'LANGUAGE'},
     "location": {'GPE', 'LOC'},
@@ -137,32 +136,43 @@ entities = {
     "ethnicity+location+people": {'NORP', 'LANGUAGE', 'GPE', 'LOC', 'PERSON'},
 }
 
-df = pd.read_csv(f"{main_dir}/data/{file}.csv")
-
-# 3 NON-ETHNICITY ENTITIES
-df["ner_no_ethn_bio"] = clean_column_to_18_specific_entities(in_col="mini_bio", entities=entities["ethnicity"], reason="remove specific ethnicity labels")
-df.to_csv(f"{main_dir}/data/{file}.csv", index=False)
-
-# 4 NON-LOCATION ENTITIES
-df["ner_no_loc_bio"] = clean_column_to_18_specific_entities(in_col=df["mini_bio"], entities=entities["location"], reason="remove information about cities, states, and countries")
-df.to_csv(f"{main_dir}/data/{file}.csv", index=False)
-
-# 5 NON-PERSON ENTITIES
-df["ner_no_ppl_bio"] = clean_column_to_18_specific_entities(in_col=df["mini_bio"], entities=entities["people"], reason="remove person names")
-df.to_csv(f"{main_dir}/data/{file}.csv", index=False)
-
-# 6 NO ETHNICITY AND NO PERSON ENTITIES
-df["ner_no_ethn+ppl_bio"] = clean_column_to_18_specific_entities(in_col=df["mini_bio"], entities=entities["ethnicity+people"], reason="remove person and ethnicity names")
-df.to_csv(f"{main_dir}/data/{file}.csv", index=False)
-
-# 7 NO ETHNICITY AND NO LOCATION ENTITIES
-df["ner_no_ethn+loc_bio"] = clean_column_to_18_specific_entities(in_col=df["mini_bio"], entities=entities["ethnicity+location"], reason="remove ethnicity and location names")
-df.to_csv(f"{main_dir}/data/{file}.csv", index=False)
-
-# 8 NO LOCATION AND NO PERSON ENTITIES
-df["ner_no_loc+ppl_bio"] = clean_column_to_18_specific_entities(in_col=df["mini_bio"], entities=entities["location+people"], reason="remove person and location names")
-df.to_csv(f"{main_dir}/data/{file}.csv", index=False)
-
-# 9 NO ETHNICITY AND NO LOCATION AND NO PERSON ENTITIES
-df["ner_no_ppl+ethn+loc_bio"] = clean_column_to_18_specific_entities(in_col=df["mini_bio"], entities=entities["ethnicity+location+people"], reason="remove person,ethnicity, and location names")
-df.to_csv(f"{main_dir}/data/{file}.csv", index=False)
+def main():
+    ### Create initial `test_sample_metadata_with_ner` and `test_sample_metadata_with_ner18` ##########
+    # 1 All ENTITIES
+    # clean_to_4()
+
+    # 2 ALL ENTITIES (18 CATEGORY MODEL)
+    # clean_to_18()
+
+    file = "test_sample_metadata_with_ner18"
+    dataset = get_dataset(file)
+    df = dataset.read(["mini_bio"])
+    # every bio is tagged once, and rewritten once for all of the variants below
+    spans = get_span_store(df["mini_bio"], f"{main_dir}/data/{file}_spans.npz")
+    ablations = {
+        # 3 NON-ETHNICITY ENTITIES
+        "ner_no_ethn_bio": ("ethnicity", "remove specific ethnicity labels"),
+        # 4 NON-LOCATION ENTITIES
+        "ner_no_loc_bio": ("location", "remove information about cities, states, and countries"),
+        # 5 NON-PERSON ENTITIES
+        "ner_no_ppl_bio": ("people", "remove person names"),
+        # 6 NO ETHNICITY AND NO PERSON ENTITIES
+        "ner_no_ethn+ppl_bio": ("ethnicity+people", "remove person and ethnicity names"),
+        # 7 NO ETHNICITY AND NO LOCATION ENTITIES
+        "ner_no_ethn+loc_bio": ("ethnicity+location", "remove ethnicity and location names"),
+        # 8 NO LOCATION AND NO PERSON ENTITIES
+        "ner_no_loc+ppl_bio": ("location+people", "remove person and location names"),
+        # 9 NO ETHNICITY AND NO LOCATION AND NO PERSON ENTITIES
+        "ner_no_ppl+ethn+loc_bio": ("ethnicity+location+people", "remove person,ethnicity, and location names"),
+    }
+    for entity_name, reason in ablations.values():
+        print(f"TASK: Ablate flair entities {entities[entity_name]}.\nREASON: {reason}")
+    variants = spans.variants({column: entities[entity_name] for column, (entity_name, _) in ablations.items()},
+                              mode=substitution_mode)
+    # only the new columns are written, the rest of the dataset is left as it is
+    dataset.write_columns(pd.DataFrame(variants))
+    if export_csv:
+        dataset.to_csv(f"{main_dir}/data/{file}.csv")
+
+if __name__ == "__main__":
+    main()
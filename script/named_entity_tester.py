@@ -1,13 +1,19 @@
 import pandas as pd
-import mapply
 import numpy as np
+import json
+import os
 import sys
 sys.path.append("../script")
-import text_preprocessing
-from transformers import DistilBertTokenizerFast
-from transformers import TFDistilBertForSequenceClassification
-import tensorflow as tf
-from sklearn.metrics import classification_report
+import race_classifier
+import model_loader
+import inference_backends
+import parallel_scoring
+import parse_store
+from score_store import ScoreStore
+from prediction_cache import PredictionCache
+from preprocess_cache import PreprocessCache
+from tokenized_corpus import TokenizedCorpus, MANIFEST_FILE
+from dataset_store import read_columns
 from tqdm import tqdm
 ######################################################################################
 # This file is used to test the performance of our DistilBERT race classifier
@@ -26,7 +32,8 @@ def test_original_bio():
     0 NO ENTITIES
     '''
     in_file = "test_sample_metadata"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="mini_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="mini_bio",
+                               score_path=f"{main_dir}/data/{in_file}_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_outfile.csv", index=None)
 
 def test_ner_bio():
@@ -34,7 +41,8 @@ def test_ner_bio():
     1 ALL ENTITIES
     '''
     in_file = "test_sample_metadata_with_ner"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_bio",
+                               score_path=f"{main_dir}/data/{in_file}_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_outfile.csv", index=None)
 
 def test_ner18_bio():
@@ -42,7 +50,8 @@ def test_ner18_bio():
     2 ALL ENTITIES with 18 categories
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_bio",
+                               score_path=f"{main_dir}/data/{in_file}_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_outfile.csv", index=None)
 
 def test_ner_no_ethn_bio():
@@ -50,7 +59,8 @@ def test_ner_no_ethn_bio():
     3 NON-ETHNICITY ENTITY with 18 categories
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ethnicity_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ethnicity_bio",
+                               score_path=f"{main_dir}/data/{in_file}_ethn_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_ethn_outfile.csv", index=None)
 
 def test_ner_no_loc_bio():
@@ -58,7 +68,8 @@ def test_ner_no_loc_bio():
     4 NON-LOCATION ENTITIES
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_loc_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_loc_bio",
+                               score_path=f"{main_dir}/data/{in_file}_loc_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_loc_outfile.csv", index=None)
 
 def test_ner_no_ppl_bio():
@@ -66,7 +77,8 @@ def test_ner_no_ppl_bio():
     5 NON-PERSON ENTITIES
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ppl_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ppl_bio",
+                               score_path=f"{main_dir}/data/{in_file}_ppl_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_ppl_outfile.csv", index=None)
 
 def test_ner_no_ethn_ppl_bio():
@@ -74,7 +86,8 @@ def test_ner_no_ethn_ppl_bio():
     6 NO ETHNICITY+PERSON ENTITIES
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ethn+ppl_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ethn+ppl_bio",
+                               score_path=f"{main_dir}/data/{in_file}_ethn+ppl_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_ethn+ppl_outfile.csv", index=None)
 
 def test_ner_no_ethn_loc_bio():
@@ -82,7 +95,8 @@ def test_ner_no_ethn_loc_bio():
     7 NO ETHNICITY+LOCATION ENTITIES
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ethn+loc_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ethn+loc_bio",
+                               score_path=f"{main_dir}/data/{in_file}_ethn+loc_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_ethn+loc_outfile.csv", index=None)
 
 def test_ner_no_loc_ppl_bio():
@@ -90,7 +104,8 @@ def test_ner_no_loc_ppl_bio():
     8 NO LOCATION+PEOPLE ENTITIES
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_loc+ppl_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_loc+ppl_bio",
+                               score_path=f"{main_dir}/data/{in_file}_loc+ppl_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_loc+ppl_outfile.csv", index=None)
 
 def test_ner_no_ppl_ethn_loc_bio():
@@ -98,11 +113,110 @@ def test_ner_no_ppl_ethn_loc_bio():
     9 NO PEOPLE+ETHNICITY+LOCATION ENTITIES
     '''
     in_file = "test_sample_metadata_with_ner18"
-    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ppl+ethn+loc_bio")
+    pred_df = predict_race_for(file_path=f"{main_dir}/data/{in_file}.csv", col_name="ner_no_ppl+ethn+loc_bio",
+                               score_path=f"{main_dir}/data/{in_file}_ppl+ethn+loc_scores.npz")
     pred_df.to_csv(f"{main_dir}/data/{in_file}_ppl+ethn+loc_outfile.csv", index=None)
 
 
+def test_original_bio_stream():
+    '''
+    0 NO ENTITIES, scored chunk by chunk (re-running resumes after the last finished chunk)
+    '''
+    in_file = "test_sample_metadata"
+    predict_race_for_stream(file_path=f"{main_dir}/data/{in_file}.csv", col_name="mini_bio",
+                            out_path=f"{main_dir}/data/{in_file}_outfile.csv")
+
+def test_ner18_variants():
+    '''
+    3-9 ALL ABLATION VARIANTS in one pass (identical texts are only scored once)
+    '''
+    in_file = "test_sample_metadata_with_ner18"
+    col_names = ["ner_no_ethn_bio", "ner_no_loc_bio", "ner_no_ppl_bio", "ner_no_ethn+ppl_bio",
+                 "ner_no_ethn+loc_bio", "ner_no_loc+ppl_bio", "ner_no_ppl+ethn+loc_bio"]
+    pred_df = predict_race_for_columns(file_path=f"{main_dir}/data/{in_file}.csv", col_names=col_names,
+                                       score_prefix=f"{main_dir}/data/{in_file}")
+    pred_df.to_csv(f"{main_dir}/data/{in_file}_variants_outfile.csv", index=None)
+
+
 ############################################ HELPER FUNCTIONS ###########################################
+def get_tokenizer():
+    return model_loader.get_tokenizer(model_dir)
+
+def get_model():
+    '''
+    classifier wrapped in the backend selected by `backend_name`
+    '''
+    return inference_backends.load_backend(backend_name, model_dir, export_dir)
+
+def get_cache():
+    '''
+    logits of texts already scored with these exact weights (and backend) are read back instead of recomputed
+    '''
+    if not use_cache:
+        return None
+    weights_dirs = inference_backends.backend_weights_dirs(backend_name, model_dir, export_dir)
+    return model_loader.load_once(("prediction_cache", weights_dirs),
+                                  lambda: PredictionCache(cache_path, weights_dirs))
+
+def get_preprocess_cache():
+    '''
+    token lists of bios already preprocessed (in any earlier run) are read back instead of recomputed
+    '''
+    if not use_preprocess_cache:
+        return None
+    return model_loader.load_once(("preprocess_cache", preprocess_cache_path),
+                                  lambda: PreprocessCache(preprocess_cache_path))
+
+def get_parse_store():
+    '''
+    spaCy parses (without NER) of normalized bios are read back instead of parsed again
+    '''
+    if not use_parse_store:
+        return None
+    return model_loader.load_once(("parse_store", parse_store_path),
+                                  lambda: parse_store.normalized_store(parse_store_path))
+
+def prepare_texts(raw_texts):
+    '''
+    `race_classifier.prepare_texts` through the preprocess cache and parse store; new parses are saved
+    '''
+    texts = race_classifier.prepare_texts(raw_texts, preprocess_cache=get_preprocess_cache(),
+                                          parse_store=get_parse_store())
+    store = get_parse_store()
+    if store is not None and store.added:
+        store.save()
+    return texts
+
+def get_corpus(file_path, col_name, n_rows):
+    '''
+    Pre-tokenized ids of `col_name` (see tokenized_corpus.py), if a corpus was built for it and still
+    matches the file and the tokenizer; None otherwise
+    e.g. ../data/test_sample_metadata.csv, mini_bio --> ../data/tokenized/test_sample_metadata-mini_bio
+    '''
+    if not use_tokenized_corpus or long_text_pooling:
+        return None
+    path = f"{corpus_dir}/{os.path.splitext(os.path.basename(file_path))[0]}-{col_name}"
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    corpus = TokenizedCorpus(path)
+    manifest = corpus.manifest
+    if len(corpus) != n_rows or (os.path.exists(file_path) and
+                                 os.path.getmtime(file_path) > os.path.getmtime(manifest_path)):
+        print(f"Not using {path}, {file_path} changed after it was built")
+        return None
+    # same inputs as score_batch: preprocessed, truncated at the model's maximum length
+    if not manifest["preprocess"] or not manifest["truncation"] or \
+            manifest["max_length"] != get_tokenizer().model_max_length:
+        print(f"Not using {path}, it was not built with the tester's preprocessing and truncation")
+        return None
+    try:
+        corpus.check(get_tokenizer())
+    except ValueError as e:
+        print(f"Not using {e}")
+        return None
+    return corpus
+
 def predict_one(raw_text):
     '''
     Params:
@@ -110,28 +224,69 @@ def predict_one(raw_text):
     Returns:
         prediction_value: one of {0, 1, 2, 3} which maps to {Asian, Black, Hispanic, White}
     '''
-    text = ' '.join(text_preprocessing.preprocess(raw_text, lemmatization=True))
-    predict_input = loaded_tokenizer.encode(text,
-                                  truncation=True,
-                                  padding=True,
-                                  return_tensors="tf")
+    return predict_batch([raw_text], progress=False)[0]
+
+def predict_batch(raw_texts, batch_size=32, progress=True):
+    '''
+    Params:
+        raw_texts: Series or list of unprocessed biography text
+    Returns:
+        predictions: array of {0, 1, 2, 3} in the same order as `raw_texts`
+    '''
+    return score_batch(raw_texts, batch_size=batch_size, progress=progress).argmax(axis=1)
 
-    output = loaded_model(predict_input)[0]
-    prediction_value = tf.argmax(output, axis=1).numpy()[0]
-    return prediction_value
+def score_batch(raw_texts, batch_size=32, progress=True, preprocess=True):
+    '''
+    Params:
+        raw_texts: Series or list of unprocessed biography text
+        preprocess: False if `raw_texts` already went through `text_preprocessing.preprocess`
+    Returns:
+        logits: float32 array of shape (len(raw_texts), 4) for {Asian, Black, Hispanic, White}
+    '''
+    if preprocess and use_parse_store:
+        # parsed here, in one process, since workers cannot share the parse store
+        raw_texts = prepare_texts(raw_texts)
+        preprocess = False
+    if long_text_pooling:
+        logits, n_truncated = race_classifier.score_long_texts(raw_texts, get_tokenizer(), get_model(),
+                                                               batch_size=batch_size, preprocess=preprocess,
+                                                               pooling=long_text_pooling, progress=progress,
+                                                               preprocess_cache=get_preprocess_cache())
+        print(f"{n_truncated} of {len(logits)} bios are longer than one {get_tokenizer().model_max_length} token window")
+        return logits
+    if n_workers > 1:
+        return parallel_scoring.score_parallel(
+            raw_texts, model_dir, n_workers=n_workers, batch_size=batch_size, preprocess=preprocess,
+            backend_name=backend_name, export_dir=export_dir, cache_path=cache_path if use_cache else None,
+            preprocess_cache_path=preprocess_cache_path if use_preprocess_cache else None, progress=progress)
+    return race_classifier.score_batch(raw_texts, get_tokenizer(), get_model(), batch_size=batch_size,
+                                       preprocess=preprocess, progress=progress, cache=get_cache(),
+                                       preprocess_cache=get_preprocess_cache())
 
-def predict_race_for(file_path, col_name, should_eval=True):
+def predict_race_for(file_path, col_name, should_eval=True, batch_size=32, score_path=None):
     '''
-    Predicts race label using `predict` function
+    Scores every bio once; labels, probabilities and the report all come from the resulting `ScoreStore`
+    Params:
+        score_path: if given, the raw logits are saved there (see score_store.py)
     Returns:
-        test_predictions: list of race label predictions
+        pred_df: name, href, text, label, race label prediction and the 4 race probabilities
     '''
-    test_df = pd.read_csv(file_path)
+    # only the needed columns, from the dataset store of `file_path` if there is one (see dataset_store.py)
+    test_df = read_columns(file_path, ["name", "href", col_name, "label"])
     test_df = test_df.replace(np.nan, "", regex=True)
-    tqdm.pandas(desc="progress bar!")
-    test_df["pred"] = test_df[col_name].progress_apply(predict_one)
+    corpus = get_corpus(file_path, col_name, len(test_df))
+    if corpus is not None:
+        # token ids are sliced from the memory-mapped corpus, no bio is preprocessed or tokenized again
+        logits = corpus.score(get_model(), batch_size=batch_size)
+    else:
+        logits = score_batch(test_df[col_name], batch_size=batch_size)
+    scores = ScoreStore(test_df["href"], logits)
+    if score_path:
+        scores.save(score_path)
 
-    pred_df = test_df[["name", "href", col_name, "label", "pred"]]
+    test_df["pred"] = scores.labels()
+    pred_df = test_df[["name", "href", col_name, "label", "pred"]].copy()
+    pred_df[race_classifier.RACES] = scores.probs()
 
     # test_predictions = [predict_one(text) for text in tqdm(test_df[col_name])]
     # pred_df = pd.DataFrame({
@@ -142,43 +297,174 @@ def predict_race_for(file_path, col_name, should_eval=True):
     #                     "pred": test_predictions
     #                                             })
     if should_eval:
-        print(classification_report(pred_df["label"], pred_df["pred"]))
+        print(scores.report(pred_df["label"]))
+    return pred_df
+
+def predict_race_for_columns(file_path, col_names, should_eval=True, batch_size=32, score_prefix=None):
+    '''
+    Predicts race labels for several text columns of one file in a single pass.
+    The file is read once, every bio is preprocessed once and each unique preprocessed
+    text (by hash) is sent through the model once, no matter how many columns contain it.
+    Params:
+        col_names: e.g. ["ner_no_loc_bio", "ner_no_ppl_bio"]
+        score_prefix: if given, logits of each column are saved to f"{score_prefix}_{col}_scores.npz"
+    Returns:
+        pred_df: name, href, label and one `{col}_pred` column per entry of `col_names`
+    '''
+    test_df = read_columns(file_path, ["name", "href", "label", *col_names])
+    test_df = test_df.replace(np.nan, "", regex=True)
+
+    # preprocess each distinct raw text once, then key the model inputs by content hash
+    raw_texts = pd.unique(test_df[col_names].to_numpy().ravel())
+    prepared = dict(zip(raw_texts, prepare_texts(raw_texts)))
+    unique_texts = {}
+    codes = {}
+    for col in col_names:
+        keys = [race_classifier.text_hash(prepared[text]) for text in test_df[col]]
+        for key, text in zip(keys, test_df[col]):
+            unique_texts.setdefault(key, prepared[text])
+        codes[col] = keys
+
+    print(f"Scoring {len(unique_texts)} unique texts for {len(test_df) * len(col_names)} bios")
+    logits = score_batch(list(unique_texts.values()), batch_size=batch_size, preprocess=False)
+    position = {key: i for i, key in enumerate(unique_texts)}
+
+    pred_df = test_df[["name", "href", "label"]].copy()
+    for col in col_names:
+        scores = ScoreStore(test_df["href"], logits[[position[key] for key in codes[col]]])
+        if score_prefix:
+            scores.save(f"{score_prefix}_{col}_scores.npz")
+        pred_df[f"{col}_pred"] = scores.labels()
+        if should_eval:
+            print(col)
+            print(scores.report(pred_df["label"]))
     return pred_df
 
+def predict_race_for_stream(file_path, col_name, out_path, should_eval=True, batch_size=32, chunksize=1000):
+    '''
+    Streaming, resumable version of `predict_race_for` for large files.
+    Reads only the needed columns, `chunksize` rows at a time, and appends each scored chunk
+    to `out_path`. After every chunk a checkpoint (f"{out_path}.checkpoint.json") records how
+    many rows are done, so a restarted job skips them and continues with the next chunk.
+    Returns:
+        number of rows written to `out_path`
+    '''
+    checkpoint_path = f"{out_path}.checkpoint.json"
+    job = {"file_path": os.path.abspath(file_path), "col_name": col_name}
+    checkpoint = {**job, "rows_done": 0, "out_bytes": 0, "complete": False}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if {key: checkpoint[key] for key in job} != job:
+            raise ValueError(f"{checkpoint_path} belongs to another job: {checkpoint}")
+        print(f"Resuming {file_path} after {checkpoint['rows_done']} rows")
+
+    if not checkpoint["complete"]:
+        # drop anything written after the last checkpoint (e.g. a chunk interrupted mid-write)
+        with open(out_path, "ab") as f:
+            f.truncate(checkpoint["out_bytes"])
+
+        columns = ["name", "href", col_name, "label"]
+        rows_seen = 0
+        reader = pd.read_csv(file_path, usecols=columns, chunksize=chunksize)
+        for chunk in tqdm(reader, desc="chunks"):
+            rows_seen += len(chunk)
+            # skip rows finished by an earlier run (not `skiprows`, bios can span several lines)
+            chunk = chunk.iloc[max(0, len(chunk) - (rows_seen - checkpoint["rows_done"])):]
+            if chunk.empty:
+                continue
+            chunk = chunk[columns].replace(np.nan, "", regex=True)
+            logits = score_batch(chunk[col_name], batch_size=batch_size, progress=False)
+            chunk["pred"] = logits.argmax(axis=1)
+            chunk[race_classifier.RACES] = race_classifier.softmax(logits)
+            with open(out_path, "a", newline="", encoding="utf-8") as f:
+                chunk.to_csv(f, header=checkpoint["rows_done"] == 0, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+
+            checkpoint["rows_done"] += len(chunk)
+            checkpoint["out_bytes"] = os.path.getsize(out_path)
+            write_checkpoint(checkpoint_path, checkpoint)
+
+        checkpoint["complete"] = True
+        write_checkpoint(checkpoint_path, checkpoint)
+
+    if should_eval:
+        from sklearn.metrics import classification_report
+        pred_df = pd.read_csv(out_path, usecols=["label", "pred"])
+        print(classification_report(pred_df["label"], pred_df["pred"]))
+    return checkpoint["rows_done"]
+
+def write_checkpoint(checkpoint_path, checkpoint):
+    '''
+    Replaces the checkpoint atomically, so a crash never leaves a half-written file
+    '''
+    with open(f"{checkpoint_path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
 ############################################# DO HERE ###################################################
 
 main_dir = ".."
-mapply.init(n_workers=-1, chunk_size=1, max_chunks_per_worker=10, progressbar=True)
+# tokenizer, model and prediction cache are loaded on first use (see model_loader.py)
+model_dir = f"{main_dir}/model/distilbert"
+# "eager", or "graph" / "int8" after running `python inference_backends.py export`
+backend_name = "eager"
+export_dir = f"{main_dir}/model/distilbert-export"
+use_cache = True
+cache_path = f"{main_dir}/data/prediction_cache.sqlite"
+# preprocessed bios, shared by all runs (fill it in bulk with `python preprocess_cache.py warm <csv> <columns>`)
+use_preprocess_cache = True
+preprocess_cache_path = f"{main_dir}/data/preprocess_cache.sqlite"
+# spaCy parses of the bios preprocessing misses (fill it with `python parse_store.py build <dir> <csv> <columns>`)
+use_parse_store = False
+parse_store_path = f"{main_dir}/data/parse_store"
+# columns with a pre-tokenized corpus here are scored from it, in this process and without the prediction cache
+# (build one with `python tokenized_corpus.py build <csv> <column> <corpus_dir>/<csv name>-<column>`)
+use_tokenized_corpus = True
+corpus_dir = f"{main_dir}/data/tokenized"
+# > 1 scores with a pool of worker processes, each holding its own model (see parallel_scoring.py)
+n_workers = 1
+# None truncates long bios at 512 tokens; "mean", "max", "mean_probs" or "weighted" scores
+# every overlapping 512 token window of a bio and pools them (see race_classifier.score_long_texts)
+long_text_pooling = None
+
+# the tests run under main() only: with n_workers > 1 every worker process re-imports this file
+def main():
+    # 0 ORIGINAL
+    # test_original_bio()
+    # test_original_bio_stream()
 
-loaded_tokenizer = DistilBertTokenizerFast.from_pretrained(f"{main_dir}/model/distilbert")
-loaded_model = TFDistilBertForSequenceClassification.from_pretrained(f"{main_dir}/model/distilbert")
+    ## 1 All ENTITIES
+    # test_ner_bio()
 
-# 0 ORIGINAL
-# test_original_bio()
+    ## 2 ALL ENTITIES (18 CATEGORY MODEL)
+    # test_ner18_bio()
 
-## 1 All ENTITIES
-# test_ner_bio()
+    ## 3 NON-ETHNICITY ENTITIES
+    # test_ner_no_ethn_bio()
 
-## 2 ALL ENTITIES (18 CATEGORY MODEL)
-# test_ner18_bio()
+    ## 4 NON-LOCATION ENTITIES
+    # test_ner_no_loc_bio()
 
-## 3 NON-ETHNICITY ENTITIES
-# test_ner_no_ethn_bio()
+    # # 5 NON-PERSON ENTITIES
+    # test_ner_no_ppl_bio()
 
-## 4 NON-LOCATION ENTITIES
-# test_ner_no_loc_bio()
+    # # 6 NO ETHNICITY+PERSON ENTITIES
+    # test_ner_no_ethn_ppl_bio()
 
-# # 5 NON-PERSON ENTITIES
-# test_ner_no_ppl_bio()
+    # # 7 NO ETHNICITY+LOCATION ENTITIES
+    # test_ner_no_ethn_loc_bio()
 
-# # 6 NO ETHNICITY+PERSON ENTITIES
-# test_ner_no_ethn_ppl_bio()
+    # # 8 NO LOCATION+PEOPLE ENTITIES
+    # test_ner_no_loc_ppl_bio()
 
-# # 7 NO ETHNICITY+LOCATION ENTITIES
-# test_ner_no_ethn_loc_bio()
+    # # 9 NO PEOPLE+ETHNICITY+LOCATION ENTITIES
+    # test_ner_no_ppl_ethn_loc_bio()
 
-# # 8 NO LOCATION+PEOPLE ENTITIES
-# test_ner_no_loc_ppl_bio()
+    # # 3-9 ALL VARIANTS IN ONE PASS
+    # test_ner18_variants()
+    pass
 
-# # 9 NO PEOPLE+ETHNICITY+LOCATION ENTITIES
-# test_ner_no_ppl_ethn_loc_bio()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import re
+from tqdm import tqdm
+import model_loader
+
+######################################################################################
+# Bulk Flair NER tagging.
+#
+# Bios are sorted by length and handed to `SequenceTagger.predict` as lists of
+# Sentences, so every mini batch holds bios of similar length and little padding.
+# `tag_parallel` splits the sorted bios into contiguous chunks for a fixed pool of
+# worker processes, each loading the tagger once in the pool initializer. Results are
+# plain (picklable) records, returned in the original order.
+#
+# With `max_words`, bios are first split into sentences (segtok), sentences longer than
+# that many words are cut further, and the segments of all bios are tagged together;
+# token and character offsets are then shifted back to whole-bio positions. Sequence
+# length (and so padding and memory) stays bounded however long a bio is, but the
+# tagger no longer sees context across sentences.
+######################################################################################
+
+_worker = {}
+WORD = re.compile(r"\S+")
+
+
+def sentence_record(sentence):
+    '''
+    Plain (picklable) copy of what a tagged flair Sentence holds
+    Returns:
+        tokens: token texts, as in `sentence.to_tokenized_string().split(" ")`
+        token_offsets: (start, end) character offset of each token
+        spans: (start token, end token, start char, end char, label, score) of each label,
+               e.g. "Span[0:2]: "Hortensia Santoveña" → PERSON (0.9905)" --> (0, 2, 0, 19, "PERSON", 0.9905)
+    '''
+    tokens = [token.text for token in sentence]
+    token_offsets = [(token.start_position, token.end_position) for token in sentence]
+    spans = []
+    for label in sentence.get_labels():
+        span_tokens = label.data_point.tokens
+        # flair token indices are 1-based, Span[start:end] in str(label) is not
+        start, end = span_tokens[0].idx - 1, span_tokens[-1].idx
+        spans.append((start, end, token_offsets[start][0], token_offsets[end - 1][1], label.value, label.score))
+    return tokens, token_offsets, spans
+
+
+def length_order(texts):
+    '''
+    Row numbers from the longest to the shortest text
+    '''
+    return sorted(range(len(texts)), key=lambda row: len(texts[row]), reverse=True)
+
+
+def split_sentences(text):
+    '''
+    Sentences of a bio, found with segtok (the splitter behind flair's SegtokSentenceSplitter),
+    which keeps abbreviations and initials such as "D.C.", "Dr." or "J." inside their sentence
+    Returns:
+        list of (start char, sentence)
+    '''
+    from segtok.segmenter import split_single
+    sentences = []
+    cursor = 0
+    for sentence in split_single(text):
+        start = text.find(sentence, cursor)
+        if not sentence or start < 0:
+            continue
+        sentences.append((start, sentence))
+        cursor = start + len(sentence)
+    return sentences
+
+
+def split_segments(text, max_words=64):
+    '''
+    Splits a bio into sentences (see `split_sentences`); only sentences longer than `max_words`
+    words are further cut every `max_words` words
+    Returns:
+        list of (start char, segment)
+
+    e.g. "Ang Lee moved to Washington, D.C. in 1970. He was born in Taiwan."
+         --> [(0, "Ang Lee moved to Washington, D.C. in 1970."), (43, "He was born in Taiwan.")]
+    '''
+    segments = []
+    for start, sentence in split_sentences(text):
+        words = [word.span() for word in WORD.finditer(sentence)]
+        if len(words) <= max_words:
+            segments.append((start, sentence))
+            continue
+        for i in range(0, len(words), max_words):
+            first, last = words[i][0], words[min(i + max_words, len(words)) - 1][1]
+            segments.append((start + first, sentence[first:last]))
+    return segments
+
+
+def segment_bios(texts, max_words):
+    '''
+    Returns:
+        (row, start char, segment) of every segment of every bio, in bio order
+    '''
+    return [(row, start, segment) for row, text in enumerate(texts)
+            for start, segment in split_segments(text, max_words)]
+
+
+def merge_segments(n_texts, segments, segment_records):
+    '''
+    Joins the records of the segments of each bio into one record with whole-bio offsets
+    '''
+    records = [([], [], []) for _ in range(n_texts)]
+    for (row, shift, _), (tokens, token_offsets, spans) in zip(segments, segment_records):
+        row_tokens, row_offsets, row_spans = records[row]
+        first = len(row_tokens)
+        row_spans.extend((start + first, end + first, char_start + shift, char_end + shift, label, score)
+                         for start, end, char_start, char_end, label, score in spans)
+        row_tokens.extend(tokens)
+        row_offsets.extend((start + shift, end + shift) for start, end in token_offsets)
+    return records
+
+
+def tag_many(texts, tagger, mini_batch_size=32, chunk_size=1024, max_words=None, progress=False):
+    '''
+    Tags bios in length-sorted chunks, one `predict` call per chunk
+    Params:
+        mini_batch_size: Sentences per forward pass of the tagger
+        chunk_size: Sentences alive at a time; bounds memory on large corpora
+        max_words: if given, bios are tagged sentence by sentence, longer sentences cut at this many words
+                   (see `split_segments`)
+    Returns:
+        one `sentence_record` per text, in the original order
+    '''
+    from flair.data import Sentence
+    texts = ["" if not isinstance(text, str) else text for text in texts]
+    if max_words:
+        segments = segment_bios(texts, max_words)
+        segment_records = tag_many([segment for _, _, segment in segments], tagger, mini_batch_size=mini_batch_size,
+                                   chunk_size=chunk_size, progress=progress)
+        return merge_segments(len(texts), segments, segment_records)
+    order = length_order(texts)
+    records = [None] * len(texts)
+    for start in tqdm(range(0, len(order), chunk_size), desc="chunks", disable=not progress):
+        rows = order[start:start + chunk_size]
+        sentences = [Sentence(texts[row]) for row in rows]
+        tagger.predict(sentences, mini_batch_size=mini_batch_size)
+        for row, sentence in zip(rows, sentences):
+            records[row] = sentence_record(sentence)
+    return records
+
+
+def _init_worker(tagger_name, threads):
+    import torch
+    # split the cores between workers instead of every worker grabbing all of them
+    torch.set_num_threads(threads)
+    _worker["tagger"] = model_loader.get_flair_tagger(tagger_name)
+
+
+def _tag_chunk(task):
+    rows, texts, mini_batch_size = task
+    return rows, tag_many(texts, _worker["tagger"], mini_batch_size=mini_batch_size, chunk_size=max(1, len(texts)))
+
+
+def tag_parallel(texts, tagger_name=model_loader.FLAIR_TAGGER, n_workers=None, chunk_size=256, mini_batch_size=32,
+                 max_words=None, progress=True):
+    '''
+    Same output as `tag_many`, computed by a pool of worker processes
+    Params:
+        tagger_name: e.g. "flair/ner-english-ontonotes-fast"; loaded once per worker
+        n_workers: number of processes (all cores if not given)
+        chunk_size: bios handed to a worker at a time, consecutive in length order
+        max_words: if given, bios are tagged sentence by sentence, longer sentences cut at this many words
+                   (see `split_segments`)
+    Returns:
+        one `sentence_record` per text, in the original order
+    '''
+    texts = ["" if not isinstance(text, str) else text for text in texts]
+    if max_words:
+        segments = segment_bios(texts, max_words)
+        segment_records = tag_parallel([segment for _, _, segment in segments], tagger_name, n_workers=n_workers,
+                                       chunk_size=chunk_size, mini_batch_size=mini_batch_size, progress=progress)
+        return merge_segments(len(texts), segments, segment_records)
+    n_workers = n_workers or os.cpu_count()
+    threads = max(1, os.cpu_count() // n_workers)
+    order = length_order(texts)
+    tasks = []
+    for start in range(0, len(order), chunk_size):
+        rows = order[start:start + chunk_size]
+        tasks.append((rows, [texts[row] for row in rows], mini_batch_size))
+
+    records = [None] * len(texts)
+    # spawn, so workers never inherit a half-initialized torch runtime from the parent
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(n_workers, initializer=_init_worker, initargs=(tagger_name, threads)) as pool:
+        for rows, chunk_records in tqdm(pool.imap_unordered(_tag_chunk, tasks), total=len(tasks),
+                                        desc="chunks", disable=not progress):
+            for row, record in zip(rows, chunk_records):
+                records[row] = record
+    return records
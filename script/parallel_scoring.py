@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import numpy as np
+from tqdm import tqdm
+import model_loader
+import inference_backends
+import race_classifier
+from race_classifier import RACES
+
+######################################################################################
+# Multi-process scoring for the race classifier.
+#
+# N worker processes each load the tokenizer and model once (in the pool initializer)
+# and then pull large contiguous chunks of bios from the pool's shared task queue.
+# Each chunk is preprocessed, tokenized and scored in length-bucketed batches inside
+# the worker; the parent only places the returned logits back at the chunk's offset.
+######################################################################################
+
+_worker = {}
+
+
+def _init_worker(model_dir, backend_name, export_dir, cache_path, preprocess_cache_path, threads):
+    import tensorflow as tf
+    # split the cores between workers instead of every worker grabbing all of them
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    _worker["tokenizer"] = model_loader.get_tokenizer(model_dir)
+    _worker["model"] = inference_backends.load_backend(backend_name, model_dir, export_dir)
+    _worker["cache"] = None
+    if cache_path:
+        from prediction_cache import PredictionCache
+        weights_dirs = inference_backends.backend_weights_dirs(backend_name, model_dir, export_dir)
+        _worker["cache"] = PredictionCache(cache_path, weights_dirs)
+    _worker["preprocess_cache"] = None
+    if preprocess_cache_path:
+        from preprocess_cache import PreprocessCache
+        _worker["preprocess_cache"] = PreprocessCache(preprocess_cache_path)
+
+
+def _score_chunk(task):
+    start, texts, batch_size, preprocess = task
+    logits = race_classifier.score_batch(texts, _worker["tokenizer"], _worker["model"], batch_size=batch_size,
+                                         preprocess=preprocess, progress=False, cache=_worker["cache"],
+                                         preprocess_cache=_worker["preprocess_cache"])
+    return start, logits
+
+
+def score_parallel(texts, model_dir, n_workers=None, chunk_size=256, batch_size=32, preprocess=True,
+                   backend_name="eager", export_dir=None, cache_path=None, preprocess_cache_path=None, progress=True):
+    '''
+    Same output as `race_classifier.score_batch`, computed by a pool of worker processes
+    Params:
+        texts: Series or list of biography text
+        n_workers: number of processes (all cores if not given)
+        chunk_size: bios handed to a worker at a time; large enough to fill several batches
+        cache_path: optional sqlite file of a `prediction_cache.PredictionCache` shared by all workers
+        preprocess_cache_path: optional sqlite file of a `preprocess_cache.PreprocessCache` shared by all workers
+    Returns:
+        logits: float32 array of shape (len(texts), 4) in the original order
+    '''
+    texts = list(texts)
+    n_workers = n_workers or os.cpu_count()
+    threads = max(1, os.cpu_count() // n_workers)
+    tasks = [(start, texts[start:start + chunk_size], batch_size, preprocess)
+             for start in range(0, len(texts), chunk_size)]
+
+    logits = np.zeros((len(texts), len(RACES)), dtype=np.float32)
+    # spawn, so workers never inherit a half-initialized TensorFlow runtime from the parent
+    context = multiprocessing.get_context("spawn")
+    initargs = (model_dir, backend_name, export_dir, cache_path, preprocess_cache_path, threads)
+    with context.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+        for start, chunk_logits in tqdm(pool.imap_unordered(_score_chunk, tasks), total=len(tasks),
+                                        desc="chunks", disable=not progress):
+            logits[start:start + len(chunk_logits)] = chunk_logits
+    return logits
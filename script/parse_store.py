@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import pandas as pd
+import text_preprocessing
+from race_classifier import text_hash
+
+######################################################################################
+# Corpus-level store of spaCy parses.
+#
+# Every distinct text is parsed once with `nlp.pipe` and the Docs are saved as a DocBin,
+# so text_preprocessing and SpacyHelper.label_specific_entities read their parses from
+# disk instead of running en_core_web_sm again in every run.
+#
+# text_preprocessing parses the normalized (lowercased, contraction expanded) bio and
+# only reads tags and lemmas; entity relabeling parses the raw bio and needs NER. The
+# two forms are kept in separate stores, each run with only the pipes its consumer
+# reads (`normalized_store` without parser and NER, `raw_store` without parser).
+#
+# e.g. python parse_store.py build ../data/parse_store ../data/test_sample_metadata.csv mini_bio
+#      --> ../data/parse_store/raw, ../data/parse_store/normalized
+######################################################################################
+
+DOCS_FILE = "docs.spacy"
+INDEX_FILE = "index.json"
+# pipes not run for each form of a bio
+RAW_DISABLE = ("parser",)
+NORMALIZED_DISABLE = tuple(text_preprocessing.unused_pipes)
+
+
+class ParseStore:
+    def __init__(self, path, nlp=None, disable=("parser",)):
+        '''
+        Params:
+            path: directory of the store, e.g. ../data/parse_store/raw; loaded if it exists
+            nlp: spaCy pipeline, `text_preprocessing.get_nlp()` (en_core_web_sm) if not given
+            disable: pipes not run when parsing
+        '''
+        self.path = path
+        self.nlp = nlp or text_preprocessing.get_nlp()
+        self.disable = [pipe for pipe in disable if pipe in self.nlp.pipe_names]
+        self.docs = {}
+        self.added = 0
+
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            from spacy.tokens import DocBin
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["pipeline"] != self.pipeline():
+                raise ValueError(f"{path} was parsed with {index['pipeline']}, not {self.pipeline()}")
+            doc_bin = DocBin().from_disk(os.path.join(path, DOCS_FILE))
+            self.docs = dict(zip(index["keys"], doc_bin.get_docs(self.nlp.vocab)))
+
+    def pipeline(self):
+        '''
+        e.g. {"model": "en_core_web_sm-3.7.1", "pipes": ["tok2vec", "tagger", ...]}
+        '''
+        meta = self.nlp.meta
+        return {"model": f"{meta['lang']}_{meta['name']}-{meta['version']}",
+                "pipes": [pipe for pipe in self.nlp.pipe_names if pipe not in self.disable]}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __contains__(self, text):
+        return text_hash(text) in self.docs
+
+    def parse_many(self, texts, batch_size=64, n_process=1):
+        '''
+        Returns:
+            one Doc per text; texts not in the store yet are parsed (each distinct text once) and added
+        '''
+        texts = ["" if not isinstance(text, str) else text for text in texts]
+        keys = [text_hash(text) for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in self.docs}
+        if missing:
+            docs = self.nlp.pipe(missing.values(), batch_size=batch_size, n_process=n_process, disable=self.disable)
+            self.docs.update(zip(missing, docs))
+            self.added += len(missing)
+        return [self.docs[key] for key in keys]
+
+    def save(self):
+        from spacy.tokens import DocBin
+        os.makedirs(self.path, exist_ok=True)
+        DocBin(docs=self.docs.values()).to_disk(os.path.join(self.path, DOCS_FILE))
+        with open(os.path.join(self.path, INDEX_FILE), "w") as f:
+            json.dump({"pipeline": self.pipeline(), "keys": list(self.docs)}, f)
+        self.added = 0
+
+
+def raw_store(path, nlp=None):
+    '''
+    Store of raw bios, with NER (for `BiographyAblation.SpacyHelper`)
+    Params:
+        path: parent directory of both stores, e.g. ../data/parse_store
+    '''
+    return ParseStore(os.path.join(path, "raw"), nlp=nlp, disable=RAW_DISABLE)
+
+
+def normalized_store(path, nlp=None):
+    '''
+    Store of normalized bios, without NER (for `text_preprocessing.preprocess_many` and
+    `race_classifier.prepare_texts`)
+    Params:
+        path: parent directory of both stores, e.g. ../data/parse_store
+    '''
+    return ParseStore(os.path.join(path, "normalized"), nlp=nlp, disable=NORMALIZED_DISABLE)
+
+
+def build(raw, texts, normalized=None, batch_size=64, n_process=1):
+    '''
+    Parses raw bios into `raw` (for entity relabeling) and, if given, their normalized form
+    (for `text_preprocessing.preprocess_many` with default flags) into `normalized`
+    Params:
+        raw, normalized: `raw_store` and `normalized_store` of the same directory (either may be None)
+    '''
+    texts = ["" if not isinstance(text, str) else text for text in texts]
+    if raw is not None:
+        raw.parse_many(texts, batch_size=batch_size, n_process=n_process)
+    if normalized is not None:
+        normalized.parse_many([text_preprocessing.normalize_text(text) for text in texts], batch_size=batch_size,
+                              n_process=n_process)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="parse every bio of some csv columns into a store")
+    build_command.add_argument("store_path")
+    build_command.add_argument("file_path")
+    build_command.add_argument("col_names", nargs="+")
+    build_command.add_argument("--no-raw", action="store_true", help="only parse the normalized bios")
+    build_command.add_argument("--no-preprocess", action="store_true", help="only parse the raw bios")
+    build_command.add_argument("--n-process", type=int, default=1, help="spaCy processes")
+    args = parser.parse_args()
+
+    stores = {"raw": None if args.no_raw else raw_store(args.store_path),
+              "normalized": None if args.no_preprocess else normalized_store(args.store_path)}
+    df = pd.read_csv(args.file_path, usecols=args.col_names)
+    build(stores["raw"], pd.unique(df.fillna("").to_numpy().ravel()), normalized=stores["normalized"],
+          n_process=args.n_process)
+    for name, store in stores.items():
+        if store is not None:
+            print(f"Parsed {store.added} new {name} texts, {len(store)} in {store.path}")
+            store.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,8 @@ from /bio -> Overview (born, birth name, nicknames, height)
 
 
 log_file = "person_metadata.log"
+# e.g. the address of a local stand-in server when testing
+BASE_URL = "https://www.imdb.com"
 # HEADERS = {'User-Agent': 'Mozilla/5.0'}
 HEADERS = {'User-Agent' : 'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36'}
 
@@ -32,41 +34,55 @@ def get_bio_metadata(person_href, person_name, save_to_file):
     Parses biography page from imdb /bio
     '''
     try:
-        metadata = {"overview": None, "mini_bio": None, "family": None, "trademark": None, "trivia": None, "quotes": None}
         person_id = SaveData.extract_id_from_href(person_href, include_text=False)
         page_source = get_biography_page(person_id, person_name, save_to_file=save_to_file)
-        bio_content = page_source.find(id="bio_content")
-        headers = [header.get_text() for header in bio_content.find_all(class_="li_group")]
-
-        for header in headers:
-            header_item_count = re.search(r"\((.*)\)", header).group(1)
-            if "Overview" in header:
-                overview = get_overview(bio_content)
-                metadata["overview"] = overview
-            elif "Mini Bio" in header:
-                mini_bio = get_mini_bio(bio_content)
-                metadata["mini_bio"] = mini_bio
-            elif "Family" in header:
-                family = get_family(bio_content)
-                metadata["family"] = family
-            elif "Trade Mark" in header:
-                trademark = get_trademark(bio_content, int(header_item_count))
-                metadata["trademark"] = trademark
-            elif "Trivia" in header:
-                trivia = get_trivia(bio_content, int(header_item_count))
-                metadata["trivia"] = trivia
-            elif "Quotes" in header:
-                quotes = get_quotes(bio_content, int(header_item_count))
-                metadata["quotes"] = quotes
-            # else:
-            #     print(header,"\tMetadata not included")
-        return metadata["overview"], metadata["mini_bio"], metadata["family"], metadata["trademark"], metadata["trivia"], metadata["quotes"]
+        return parse_bio_metadata(page_source)
     except Exception as e:
         print(f"Failed in get_bio_metadata() {person_name} \t {person_href} \t{e}")
 
+def parse_bio_metadata(page_source):
+    '''
+    Sections of a parsed /bio page (shared by get_bio_metadata and async_scraper.py)
+    Returns:
+        overview, mini_bio, family, trademark, trivia, quotes (None for sections the page does not have)
+    '''
+    metadata = {"overview": None, "mini_bio": None, "family": None, "trademark": None, "trivia": None, "quotes": None}
+    bio_content = page_source.find(id="bio_content")
+    headers = [header.get_text() for header in bio_content.find_all(class_="li_group")]
+
+    for header in headers:
+        header_item_count = re.search(r"\((.*)\)", header).group(1)
+        if "Overview" in header:
+            overview = get_overview(bio_content)
+            metadata["overview"] = overview
+        elif "Mini Bio" in header:
+            mini_bio = get_mini_bio(bio_content)
+            metadata["mini_bio"] = mini_bio
+        elif "Family" in header:
+            family = get_family(bio_content)
+            metadata["family"] = family
+        elif "Trade Mark" in header:
+            trademark = get_trademark(bio_content, int(header_item_count))
+            metadata["trademark"] = trademark
+        elif "Trivia" in header:
+            trivia = get_trivia(bio_content, int(header_item_count))
+            metadata["trivia"] = trivia
+        elif "Quotes" in header:
+            quotes = get_quotes(bio_content, int(header_item_count))
+            metadata["quotes"] = quotes
+        # else:
+        #     print(header,"\tMetadata not included")
+    return metadata["overview"], metadata["mini_bio"], metadata["family"], metadata["trademark"], metadata["trivia"], metadata["quotes"]
+
+def get_person_url(person_id, base_url=None):
+    '''
+    e.g. 487 --> https://www.imdb.com/name/nm0000487
+    '''
+    return f'{base_url or BASE_URL}/name/nm{int(person_id):07}'
+
 def get_biography_page(person_id, person_name, save_to_file):
     try:
-        person_url = f'https://www.imdb.com/name/nm{int(person_id):07}'
+        person_url = get_person_url(person_id)
         bio_url = f'{person_url}/bio'
         response = requests.get(bio_url, headers=HEADERS)
         time.sleep(0.5)
@@ -189,7 +205,7 @@ def get_media_page(person_id, person_name):
     TODO: not sure whether this is necessary to use yet
     '''
     try:
-        person_url = f'https://www.imdb.com/name/nm{int(person_id):07}'
+        person_url = get_person_url(person_id)
         media_url = f'{person_url}/mediaindex'
         response = requests.get(media_url, headers=HEADERS)
         print(response)
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+from race_classifier import RACES
+
+######################################################################################
+# Persistent cache of classifier logits (SQLite).
+#
+# Rows are keyed by a fingerprint of the model + tokenizer files and by the hash of
+# the exact text given to the tokenizer, so a cached row can never be served for a
+# different set of weights. The least recently used rows are evicted once the cache
+# grows past `max_bytes`.
+######################################################################################
+
+
+def model_fingerprint(model_dirs):
+    '''
+    sha256 over the names and contents of every file in `model_dirs`
+    (config, weights, vocab and tokenizer settings)
+    Params:
+        model_dirs: one directory, or several (e.g. tokenizer and exported weights) in a fixed order
+    '''
+    if isinstance(model_dirs, str):
+        model_dirs = [model_dirs]
+    digest = hashlib.sha256()
+    for i, model_dir in enumerate(model_dirs):
+        # separates the directories, a single one hashes as it always did
+        if i:
+            digest.update(f"\0{i}\0".encode("utf-8"))
+        for root, dirs, files in os.walk(model_dir):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                digest.update(os.path.relpath(path, model_dir).encode("utf-8"))
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, path, model_dir, max_bytes=512 * 1024 * 1024):
+        '''
+        Params:
+            path: sqlite file, e.g. ../data/prediction_cache.sqlite
+            model_dir: directory the model and tokenizer were loaded from, e.g. ../model/distilbert, or
+                       several directories, e.g. (../model/distilbert, ../model/distilbert-export/int8)
+            max_bytes: approximate size limit of the cached rows
+        '''
+        self.path = path
+        self.model_key = model_fingerprint(model_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # generous timeout, since parallel scoring workers may share one cache file
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS logits (
+                                model TEXT NOT NULL,
+                                text TEXT NOT NULL,
+                                value BLOB NOT NULL,
+                                last_used REAL NOT NULL,
+                                PRIMARY KEY (model, text))''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS logits_last_used ON logits (last_used)")
+        self.conn.commit()
+
+    def get_many(self, text_keys):
+        '''
+        Params:
+            text_keys: `race_classifier.text_hash` of each model input
+        Returns:
+            {text_key: float32 logits} for every key that is cached
+        '''
+        found = {}
+        keys = list(dict.fromkeys(text_keys))
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT text, value FROM logits WHERE model = ? AND text IN ({','.join('?' * len(chunk))})",
+                [self.model_key, *chunk]).fetchall()
+            for key, value in rows:
+                found[key] = np.frombuffer(value, dtype=np.float32)
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE logits SET last_used = ? WHERE model = ? AND text = ?",
+                                  [(now, self.model_key, key) for key in found])
+            self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, text_keys, logits):
+        '''
+        Stores one row of `logits` (shape (n, 4)) per text key, then evicts down to `max_bytes`
+        '''
+        logits = np.asarray(logits, dtype=np.float32).reshape(-1, len(RACES))
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO logits VALUES (?, ?, ?, ?)",
+                              [(self.model_key, key, row.tobytes(), now) for key, row in zip(text_keys, logits)])
+        self.conn.commit()
+        self.evict()
+
+    def size(self):
+        '''
+        Approximate bytes used by cached rows (all models)
+        '''
+        size = self.conn.execute(
+            "SELECT SUM(LENGTH(model) + LENGTH(text) + LENGTH(value) + 8) FROM logits").fetchone()[0]
+        return size or 0
+
+    def evict(self):
+        '''
+        Deletes least recently used rows until the cache fits in `max_bytes`
+        '''
+        size = self.size()
+        if size <= self.max_bytes:
+            return
+        rows = self.conn.execute(
+            "SELECT rowid, LENGTH(model) + LENGTH(text) + LENGTH(value) + 8 FROM logits ORDER BY last_used").fetchall()
+        stale = []
+        for rowid, row_size in rows:
+            if size <= self.max_bytes:
+                break
+            stale.append((rowid,))
+            size -= row_size
+        self.conn.executemany("DELETE FROM logits WHERE rowid = ?", stale)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,109 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import text_preprocessing
+
+######################################################################################
+# Per-stage micro-benchmark for text_preprocessing on the bio corpus.
+#
+#   reference   strip_html_tags -> remove_whitespace -> remove_accented_chars ->
+#               expand_contractions -> lower, every stage run on every bio
+#   fast path   text_preprocessing.normalize_text, which skips stages that cannot change
+#               a bio; checked to give exactly the reference output
+#   tokenize    (optional, needs spaCy) nlp.pipe and clean_tokens on the normalized bios,
+#               with and without the token decision cache
+#
+# e.g. python preprocess_benchmark.py --file ../data/test_sample_metadata.csv --col-name mini_bio --tokenize
+######################################################################################
+
+REFERENCE_STAGES = [
+    ("strip_html_tags", text_preprocessing.strip_html_tags),
+    ("remove_whitespace", text_preprocessing.remove_whitespace),
+    ("remove_accented_chars", text_preprocessing.remove_accented_chars),
+    ("expand_contractions", text_preprocessing.expand_contractions),
+    ("lower", str.lower),
+]
+
+
+def time_reference(texts):
+    '''
+    Returns:
+        {stage name: seconds over all texts}, reference output
+    '''
+    seconds = {}
+    for name, stage in REFERENCE_STAGES:
+        t = time.perf_counter()
+        texts = [stage(text) for text in texts]
+        seconds[name] = time.perf_counter() - t
+    return seconds, texts
+
+
+def skip_rates(texts):
+    '''
+    Share of bios for which the fast path skips each optional stage
+    '''
+    html = np.mean([not ('<' in text or '&' in text) for text in texts])
+    texts = [" ".join(text.split()) for text in texts]
+    accents = np.mean([text.isascii() for text in texts])
+    contractions = np.mean([not text_preprocessing.has_contractions(text) for text in texts])
+    return {"strip_html_tags": html, "remove_accented_chars": accents, "expand_contractions": contractions}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default="../data/test_sample_metadata.csv")
+    parser.add_argument("--col-name", default="mini_bio")
+    parser.add_argument("--limit", type=int, default=None, help="only the first n bios")
+    parser.add_argument("--repeat", type=int, default=3, help="best of n runs")
+    parser.add_argument("--tokenize", action="store_true", help="also time spaCy tokenisation and clean_tokens")
+    args = parser.parse_args()
+
+    texts = pd.read_csv(args.file, usecols=[args.col_name], nrows=args.limit)[args.col_name]
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    text_preprocessing.contraction_triggers()  # built once per process, not part of the timings
+
+    reference, fast = None, None
+    for _ in range(args.repeat):
+        seconds, expected = time_reference(texts)
+        reference = seconds if reference is None else {k: min(v, reference[k]) for k, v in seconds.items()}
+        t = time.perf_counter()
+        normalized = [text_preprocessing.normalize_text(text) for text in texts]
+        fast = min(time.perf_counter() - t, fast or float("inf"))
+    mismatches = sum(a != b for a, b in zip(expected, normalized))
+
+    print(f"{len(texts)} bios from {args.file}:{args.col_name}, best of {args.repeat}")
+    rates = skip_rates(texts)
+    for name, seconds in reference.items():
+        skipped = f"skipped for {rates[name]:6.1%}" if name in rates else ""
+        print(f"  {name:<23}{seconds * 1000:9.1f} ms {seconds / len(texts) * 1e6:8.1f} us/bio  {skipped}")
+    total = sum(reference.values())
+    print(f"  {'reference total':<23}{total * 1000:9.1f} ms {total / len(texts) * 1e6:8.1f} us/bio")
+    print(f"  {'normalize_text':<23}{fast * 1000:9.1f} ms {fast / len(texts) * 1e6:8.1f} us/bio  "
+          f"{total / fast:.1f}x faster")
+
+    if args.tokenize:
+        nlp = text_preprocessing.get_nlp()
+        disable = [pipe for pipe in text_preprocessing.unused_pipes if pipe in nlp.pipe_names]
+        t = time.perf_counter()
+        docs = list(nlp.pipe(normalized, batch_size=64, disable=disable))
+        tokenize = time.perf_counter() - t
+        print(f"  {'nlp.pipe':<23}{tokenize * 1000:9.1f} ms {tokenize / len(texts) * 1e6:8.1f} us/bio")
+        cache_size = text_preprocessing.token_cache.maxsize
+        for name, maxsize in [("clean_tokens uncached", 0), ("clean_tokens cached", cache_size)]:
+            text_preprocessing.resize_token_cache(maxsize)
+            t = time.perf_counter()
+            for doc in docs:
+                text_preprocessing.clean_tokens(doc)
+            clean = time.perf_counter() - t
+            print(f"  {name:<23}{clean * 1000:9.1f} ms {clean / len(texts) * 1e6:8.1f} us/bio")
+        stats = text_preprocessing.token_cache_stats()
+        print(f"  token cache: {stats['hit_rate']:.1%} hits, {stats['size']} of {stats['maxsize']} entries used")
+
+    if mismatches:
+        raise SystemExit(f"normalize_text differs from the reference chain for {mismatches} bios")
+    print("normalize_text output identical to the reference chain")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import json
+import sqlite3
+import zlib
+from importlib import metadata
+import pandas as pd
+from tqdm import tqdm
+import model_loader
+import text_preprocessing
+from race_classifier import text_hash
+
+######################################################################################
+# Persistent cache of text_preprocessing output (SQLite).
+#
+# Rows are keyed by the hash of the raw text and by the exact preprocess flag set
+# (plus the spaCy model version), so every unique bio is preprocessed once instead of
+# once per run, notebook or ablation column. Token lists are stored as zlib
+# compressed json.
+#
+# e.g. python preprocess_cache.py warm ../data/test_sample_metadata.csv mini_bio
+######################################################################################
+
+# keyword arguments of text_preprocessing.preprocess, all True by default
+PREPROCESS_FLAGS = ["accented_chars", "contractions", "convert_num", "extra_whitespace", "lemmatization",
+                    "lowercase", "punctuations", "remove_html", "remove_num", "special_chars", "stop_words"]
+
+
+def flags_key(**flags):
+    '''
+    e.g. flags_key(lemmatization=True) --> "en_core_web_sm-3.7.1:accented_chars=1,contractions=1,..."
+    '''
+    unknown = set(flags) - set(PREPROCESS_FLAGS)
+    if unknown:
+        raise ValueError(f"Unknown preprocess flags {sorted(unknown)}, expected some of {PREPROCESS_FLAGS}")
+    try:
+        version = metadata.version(model_loader.SPACY_MODEL)
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+    values = ",".join(f"{flag}={int(bool(flags.get(flag, True)))}" for flag in PREPROCESS_FLAGS)
+    return f"{model_loader.SPACY_MODEL}-{version}:{values}"
+
+
+class PreprocessCache:
+    def __init__(self, path):
+        '''
+        Params:
+            path: sqlite file, e.g. ../data/preprocess_cache.sqlite
+        '''
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # generous timeout, since parallel scoring workers may share one cache file
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS tokens (
+                                flags TEXT NOT NULL,
+                                text TEXT NOT NULL,
+                                value BLOB NOT NULL,
+                                PRIMARY KEY (flags, text))''')
+        self.conn.commit()
+
+    def get_many(self, text_keys, flags):
+        '''
+        Params:
+            text_keys: `race_classifier.text_hash` of each raw text
+            flags: output of `flags_key`
+        Returns:
+            {text_key: token list} for every key that is cached
+        '''
+        found = {}
+        keys = list(dict.fromkeys(text_keys))
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT text, value FROM tokens WHERE flags = ? AND text IN ({','.join('?' * len(chunk))})",
+                [flags, *chunk]).fetchall()
+            for key, value in rows:
+                found[key] = json.loads(zlib.decompress(value))
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, text_keys, token_lists, flags):
+        self.conn.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)",
+                              [(flags, key, zlib.compress(json.dumps(tokens, separators=(",", ":")).encode("utf-8")))
+                               for key, tokens in zip(text_keys, token_lists)])
+        self.conn.commit()
+
+    def preprocess_many(self, texts, n_process=1, parse_store=None, **flags):
+        '''
+        Same output as `text_preprocessing.preprocess_many(texts, **flags)`; only texts missing
+        from the cache are preprocessed (each distinct text once) and then added to it
+        Params:
+            parse_store: optional `parse_store.normalized_store` the missing texts are parsed with
+        '''
+        texts = list(texts)
+        key = flags_key(**flags)
+        text_keys = [text_hash(text) for text in texts]
+        found = self.get_many(text_keys, key)
+        missing = {text_key: text for text_key, text in zip(text_keys, texts) if text_key not in found}
+        if missing:
+            token_lists = text_preprocessing.preprocess_many(list(missing.values()), n_process=n_process,
+                                                             parse_store=parse_store, **flags)
+            self.put_many(list(missing), token_lists, key)
+            found.update(zip(missing, token_lists))
+        return [found[text_key] for text_key in text_keys]
+
+    def size(self):
+        '''
+        Number of cached token lists (all flag sets)
+        '''
+        return self.conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def warm(cache, file_path, col_names, n_process=1, chunksize=10000, **flags):
+    '''
+    Preprocesses every bio of `col_names` in `file_path` that is not cached yet
+    Returns:
+        number of token lists added to the cache
+    '''
+    added = 0
+    for chunk in tqdm(pd.read_csv(file_path, usecols=col_names, chunksize=chunksize), desc="chunks"):
+        texts = pd.unique(chunk[col_names].fillna("").to_numpy().ravel())
+        misses = cache.misses
+        cache.preprocess_many([text if isinstance(text, str) else "" for text in texts], n_process=n_process, **flags)
+        added += cache.misses - misses
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    warm_command = commands.add_parser("warm", help="preprocess and cache every bio of some csv columns")
+    warm_command.add_argument("file_path")
+    warm_command.add_argument("col_names", nargs="+")
+    warm_command.add_argument("--cache-path", default="../data/preprocess_cache.sqlite")
+    warm_command.add_argument("--n-process", type=int, default=1, help="spaCy processes")
+    warm_command.add_argument("--chunksize", type=int, default=10000)
+    args = parser.parse_args()
+
+    cache = PreprocessCache(args.cache_path)
+    # with the flags race_classifier.prepare_texts uses
+    added = warm(cache, args.file_path, args.col_names, n_process=args.n_process, chunksize=args.chunksize,
+                 lemmatization=True)
+    print(f"Added {added} token lists, {cache.hits} were already cached ({cache.size()} in {args.cache_path})")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
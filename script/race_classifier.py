@@ -0,0 +1,212 @@
+import hashlib
+import numpy as np
+from tqdm import tqdm
+import text_preprocessing
+from inference_backends import EagerBackend
+
+######################################################################################
+# Batched inference for the DistilBERT race classifier (BioRaceBERT).
+#
+# Bios are tokenized together, sorted by token length and scored in batches that
+# are only padded to the longest bio in the batch. Predictions are returned in the
+# original order of the input.
+######################################################################################
+
+RACES = ["Asian", "Black", "Hispanic", "White"]
+
+
+def prepare_texts(texts, preprocess=True, n_process=1, preprocess_cache=None, parse_store=None):
+    '''
+    Params:
+        texts: Series or list of raw biography text
+        preprocess: run `text_preprocessing.preprocess` (as used during training)
+        n_process: spaCy processes used by `text_preprocessing.preprocess_many`
+        preprocess_cache: optional `preprocess_cache.PreprocessCache`; only texts missing from it are preprocessed
+        parse_store: optional `parse_store.normalized_store`; texts it holds are not parsed again
+    Returns:
+        list of strings ready for the tokenizer
+    '''
+    texts = ["" if not isinstance(text, str) else text for text in texts]
+    if not preprocess:
+        return texts
+    preprocess_many = text_preprocessing.preprocess_many
+    if preprocess_cache is not None:
+        preprocess_many = preprocess_cache.preprocess_many
+    return [' '.join(tokens) for tokens in preprocess_many(texts, lemmatization=True, n_process=n_process,
+                                                           parse_store=parse_store)]
+
+
+def text_hash(text):
+    '''
+    Stable content key for a (preprocessed) text
+    '''
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_texts(texts, tokenizer):
+    '''
+    Tokenizes all texts in one call (truncated to the model's maximum length)
+    Returns:
+        list of token id lists, one per text
+    '''
+    return tokenizer(list(texts), truncation=True)["input_ids"]
+
+
+def length_buckets(lengths, batch_size):
+    '''
+    Groups row indices of similar token length together
+
+    e.g. lengths=[9, 3, 7, 4], batch_size=2 --> [[1, 3], [2, 0]]
+    '''
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def pad_batch(batch_ids, pad_id, shape=None):
+    '''
+    Pads a list of token id sequences to the longest sequence in the batch
+    Params:
+        shape: (rows, length) to pad to instead, for backends with fixed input shapes
+    Returns:
+        input_ids, attention_mask: int32 arrays of shape (batch, longest)
+    '''
+    if shape is None:
+        shape = (len(batch_ids), max(len(ids) for ids in batch_ids))
+    input_ids = np.full(shape, pad_id, dtype=np.int32)
+    attention_mask = np.zeros(shape, dtype=np.int32)
+    for row, ids in enumerate(batch_ids):
+        input_ids[row, :len(ids)] = ids
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+def score_ids(ids, model, pad_id, batch_size=32, progress=True, lengths=None):
+    '''
+    Runs the classifier over pre-tokenized bios, one length bucket at a time
+    Params:
+        ids: list of token id sequences (or a `tokenized_corpus.TokenizedCorpus`)
+        model: TFDistilBertForSequenceClassification or a backend from `inference_backends`
+        pad_id: tokenizer.pad_token_id
+        lengths: token count of each row, if already known
+    Returns:
+        logits: float32 array of shape (len(ids), 4) in the original order
+    '''
+    logits = np.zeros((len(ids), len(RACES)), dtype=np.float32)
+    if len(ids) == 0:
+        return logits
+
+    backend = model if hasattr(model, "padded_shape") else EagerBackend(model)
+    batch_size = backend.batch_size or batch_size
+    if lengths is None:
+        lengths = [len(x) for x in ids]
+    buckets = length_buckets(lengths, batch_size)
+    for bucket in tqdm(buckets, desc="batches", disable=not progress):
+        batch_ids = [ids[i] for i in bucket]
+        shape = backend.padded_shape(len(bucket), max(len(x) for x in batch_ids))
+        input_ids, attention_mask = pad_batch(batch_ids, pad_id, shape=shape)
+        logits[bucket] = backend(input_ids, attention_mask)[:len(bucket)]
+    return logits
+
+
+def score_batch(texts, tokenizer, model, batch_size=32, preprocess=True, progress=True, cache=None,
+                preprocess_cache=None):
+    '''
+    Single forward pass over all texts
+    Params:
+        texts: Series or list of biography text
+        cache: optional `prediction_cache.PredictionCache`; only texts missing from it are scored
+        preprocess_cache: optional `preprocess_cache.PreprocessCache` (see `prepare_texts`)
+    Returns:
+        logits: float32 array of shape (len(texts), 4), columns ordered as `RACES`
+    '''
+    texts = prepare_texts(texts, preprocess=preprocess, preprocess_cache=preprocess_cache)
+    if cache is None:
+        ids = encode_texts(texts, tokenizer)
+        return score_ids(ids, model, tokenizer.pad_token_id, batch_size=batch_size, progress=progress)
+
+    keys = [text_hash(text) for text in texts]
+    found = cache.get_many(keys)
+    missing = {key: text for key, text in zip(keys, texts) if key not in found}
+    if missing:
+        ids = encode_texts(list(missing.values()), tokenizer)
+        logits = score_ids(ids, model, tokenizer.pad_token_id, batch_size=batch_size, progress=progress)
+        cache.put_many(list(missing), logits)
+        found.update(zip(missing, logits))
+
+    logits = np.zeros((len(texts), len(RACES)), dtype=np.float32)
+    for row, key in enumerate(keys):
+        logits[row] = found[key]
+    return logits
+
+
+def window_ids(ids, max_length=512, stride=128):
+    '''
+    Splits one bio's token ids (without [CLS]/[SEP]) into windows of max_length - 2 tokens
+    that overlap by `stride` tokens; the last window is aligned to the end of the bio
+
+    e.g. 1000 tokens, max_length=512, stride=128 --> windows starting at 0, 382, 490
+    '''
+    size = max_length - 2
+    if len(ids) <= size:
+        return [ids]
+    starts = list(range(0, len(ids) - size, size - stride)) + [len(ids) - size]
+    return [ids[start:start + size] for start in starts]
+
+
+def pool_windows(window_logits, window_lengths, pooling="mean"):
+    '''
+    Combines the logits of one bio's windows into a single row of logits
+    Params:
+        pooling: "mean"        mean of window logits
+                 "max"         per-race maximum over windows
+                 "mean_probs"  log of the mean window probability
+                 "weighted"    mean of window logits weighted by window token count
+    '''
+    if pooling == "mean":
+        return window_logits.mean(axis=0)
+    if pooling == "max":
+        return window_logits.max(axis=0)
+    if pooling == "mean_probs":
+        return np.log(softmax(window_logits).mean(axis=0))
+    if pooling == "weighted":
+        return np.average(window_logits, axis=0, weights=window_lengths)
+    raise ValueError(f"Unknown pooling {pooling}, expected one of mean, max, mean_probs, weighted")
+
+
+def score_long_texts(texts, tokenizer, model, batch_size=32, preprocess=True, max_length=512, stride=128,
+                     pooling="mean", progress=True, preprocess_cache=None):
+    '''
+    Scores whole bios instead of truncating them at `max_length` tokens. Each bio is split into
+    overlapping windows (see `window_ids`), the windows of all bios are scored together in
+    shared length-bucketed batches and then pooled back into one prediction per bio.
+    Returns:
+        logits: float32 array of shape (len(texts), 4)
+        n_truncated: number of bios that a single `score_batch` pass would have truncated
+    '''
+    texts = prepare_texts(texts, preprocess=preprocess, preprocess_cache=preprocess_cache)
+    token_ids = tokenizer(texts, add_special_tokens=False, truncation=False)["input_ids"]
+
+    windows = []
+    counts = []
+    for ids in token_ids:
+        bio_windows = window_ids(ids, max_length=max_length, stride=stride)
+        windows.extend([tokenizer.cls_token_id, *window, tokenizer.sep_token_id] for window in bio_windows)
+        counts.append(len(bio_windows))
+    n_truncated = sum(count > 1 for count in counts)
+
+    window_logits = score_ids(windows, model, tokenizer.pad_token_id, batch_size=batch_size, progress=progress)
+    window_lengths = np.array([len(window) for window in windows])
+    logits = np.zeros((len(texts), len(RACES)), dtype=np.float32)
+    bounds = np.cumsum([0, *counts])
+    for row, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        logits[row] = pool_windows(window_logits[start:end], window_lengths[start:end], pooling=pooling)
+    return logits, n_truncated
+
+
+def softmax(logits):
+    '''
+    Converts logits to Asian/Black/Hispanic/White probabilities (same as tf.nn.softmax)
+    '''
+    logits = np.asarray(logits, dtype=np.float32)
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
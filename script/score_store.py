@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from race_classifier import RACES, softmax
+
+######################################################################################
+# On-disk store for raw classifier logits.
+#
+# One store per scoring run: a float32 (n, 4) logits array indexed by `href`.
+# Labels, probabilities and classification reports are all derived from the stored
+# logits, so a corpus only needs to go through the model once.
+######################################################################################
+
+
+class ScoreStore:
+    def __init__(self, hrefs, logits):
+        '''
+        Params:
+            hrefs: person hrefs, one per row of `logits`
+            logits: array of shape (len(hrefs), 4), columns ordered as `RACES`
+        '''
+        self.hrefs = np.asarray(hrefs, dtype=str)
+        self.logits = np.asarray(logits, dtype=np.float32)
+        if self.logits.shape != (len(self.hrefs), len(RACES)):
+            raise ValueError(f"Expected logits of shape ({len(self.hrefs)}, {len(RACES)}), got {self.logits.shape}")
+        self.index = pd.Index(self.hrefs)
+
+    def save(self, path):
+        '''
+        Writes the store as a single .npz file
+        e.g. ../data/test_sample_metadata_scores.npz
+        '''
+        np.savez(path, hrefs=self.hrefs, logits=self.logits, races=np.asarray(RACES))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if list(data["races"]) != RACES:
+                raise ValueError(f"{path} was scored with classes {list(data['races'])}, expected {RACES}")
+            return cls(data["hrefs"], data["logits"])
+
+    def __len__(self):
+        return len(self.hrefs)
+
+    def logits_for(self, hrefs=None):
+        '''
+        Returns the stored logits in the order of `hrefs` (all rows if not given)
+        '''
+        if hrefs is None:
+            return self.logits
+        if not self.index.is_unique:
+            raise ValueError("Score store has duplicate hrefs, look up rows by position instead")
+        positions = self.index.get_indexer(pd.Index(hrefs).astype(str))
+        if (positions < 0).any():
+            raise KeyError(f"{int((positions < 0).sum())} hrefs are not in the score store")
+        return self.logits[positions]
+
+    def probs(self, hrefs=None):
+        '''
+        Returns - numpy arr with 4 prob categories per person
+        '''
+        return softmax(self.logits_for(hrefs))
+
+    def labels(self, hrefs=None):
+        '''
+        Returns - one of {0, 1, 2, 3} per person which maps to {Asian, Black, Hispanic, White}
+        '''
+        return self.logits_for(hrefs).argmax(axis=1)
+
+    def report(self, true_labels, hrefs=None):
+        '''
+        classification_report of the stored predictions against `true_labels`
+        '''
+        from sklearn.metrics import classification_report
+        return classification_report(true_labels, self.labels(hrefs))
+
+    def to_frame(self):
+        '''
+        href | Asian | Black | Hispanic | White | pred
+        (same probability columns as BioRaceBERT-final.csv)
+        '''
+        df = pd.DataFrame(self.probs(), columns=RACES)
+        df.insert(0, "href", self.hrefs)
+        df["pred"] = self.labels()
+        return df
@@ -0,0 +1,186 @@
+import numpy as np
+import ner_tagging
+from entity_substitution import align_offsets, substitute_variants
+from race_classifier import text_hash
+
+######################################################################################
+# On-disk store of Flair NER output, one row per bio.
+#
+# Each bio is tagged once; its tokens (text and character offsets) and its entity
+# spans (token and character offsets, label, score) are kept in flat columnar arrays
+# with per-bio offsets and saved as a single .npz file. Any entity set, including
+# combinations beyond `named_entity_cleaner.entities`, is then redacted from the
+# stored spans (see entity_substitution) without calling the tagger again.
+######################################################################################
+
+
+def pack_strings(strings):
+    '''
+    ["ab", "c"] --> uint8 utf-8 bytes b"abc", int64 offsets [0, 2, 3]
+    '''
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data, offsets):
+    data = data.tobytes()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class SpanStore:
+    def __init__(self, texts, tokens, token_offsets, token_bounds, spans, span_labels, span_scores, span_bounds,
+                 labels, aligned=None):
+        '''
+        Columnar arrays; use `from_records` or `load` rather than calling this directly
+        Params:
+            texts: original bio of each row
+            tokens: all token texts, row i owns tokens[token_bounds[i]:token_bounds[i + 1]]
+            token_offsets: int32 (n_tokens, 2) character offsets within the row's bio
+            spans: int32 (n_spans, 4) start token, end token (within the row), start char, end char
+            span_labels: int32 index into `labels` of each span
+            span_scores: float32 tagger confidence of each span
+            span_bounds: row i owns spans[span_bounds[i]:span_bounds[i + 1]]
+            labels: entity label names, e.g. ["GPE", "NORP", "PERSON"]
+            aligned: bool per row, False if its tokens could not be located in its bio (no char mode)
+        '''
+        self.texts = list(texts)
+        self.tokens = list(tokens)
+        self.token_offsets = np.asarray(token_offsets, dtype=np.int32).reshape(-1, 2)
+        self.token_bounds = np.asarray(token_bounds, dtype=np.int64)
+        self.spans = np.asarray(spans, dtype=np.int32).reshape(-1, 4)
+        self.span_labels = np.asarray(span_labels, dtype=np.int32)
+        self.span_scores = np.asarray(span_scores, dtype=np.float32)
+        self.span_bounds = np.asarray(span_bounds, dtype=np.int64)
+        self.labels = list(labels)
+        self.aligned = np.ones(len(self.texts), dtype=bool) if aligned is None else np.asarray(aligned, dtype=bool)
+        self.position = None
+
+    @classmethod
+    def from_records(cls, texts, records):
+        '''
+        Params:
+            texts: the tagged bios
+            records: one `ner_tagging.sentence_record` per bio
+        '''
+        texts = list(texts)
+        if len(texts) != len(records):
+            raise ValueError(f"Got {len(records)} tagged records for {len(texts)} bios")
+        labels = sorted({span[4] for _, _, spans in records for span in spans})
+        label_codes = {label: code for code, label in enumerate(labels)}
+        tokens, token_offsets, spans, span_labels, span_scores, aligned = [], [], [], [], [], []
+        token_bounds, span_bounds = [0], [0]
+        for text, (record_tokens, record_offsets, record_spans) in zip(texts, records):
+            # flair's offsets can drift from the bio (e.g. on characters its tokenizer rewrites)
+            offsets = align_offsets(text, record_tokens, record_offsets)
+            aligned.append(offsets is not None)
+            offsets = offsets or record_offsets
+            tokens.extend(record_tokens)
+            token_offsets.extend(offsets)
+            for start, end, _, _, label, score in sorted(record_spans):
+                spans.append((start, end, offsets[start][0], offsets[end - 1][1]))
+                span_labels.append(label_codes[label])
+                span_scores.append(score)
+            token_bounds.append(len(tokens))
+            span_bounds.append(len(spans))
+        return cls(texts, tokens, token_offsets, token_bounds, spans, span_labels, span_scores, span_bounds, labels,
+                   aligned)
+
+    def save(self, path):
+        '''
+        Writes the store as a single compressed .npz file
+        e.g. ../data/test_sample_metadata_spans.npz
+        '''
+        text_data, text_offsets = pack_strings(self.texts)
+        token_data, token_text_offsets = pack_strings(self.tokens)
+        np.savez_compressed(path, text_data=text_data, text_offsets=text_offsets,
+                            token_data=token_data, token_text_offsets=token_text_offsets,
+                            token_offsets=self.token_offsets, token_bounds=self.token_bounds,
+                            spans=self.spans, span_labels=self.span_labels, span_scores=self.span_scores,
+                            span_bounds=self.span_bounds, labels=np.asarray(self.labels, dtype=str),
+                            aligned=self.aligned)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(unpack_strings(data["text_data"], data["text_offsets"]),
+                       unpack_strings(data["token_data"], data["token_text_offsets"]),
+                       data["token_offsets"], data["token_bounds"], data["spans"], data["span_labels"],
+                       data["span_scores"], data["span_bounds"], [str(label) for label in data["labels"]],
+                       data["aligned"] if "aligned" in data.files else None)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def row_of(self, text):
+        '''
+        Row number of a stored bio, or None
+        '''
+        if self.position is None:
+            self.position = {text_hash(stored): row for row, stored in enumerate(self.texts)}
+        return self.position.get(text_hash(text))
+
+    def row_tokens(self, row):
+        return self.tokens[self.token_bounds[row]:self.token_bounds[row + 1]]
+
+    def row_spans(self, row):
+        '''
+        Returns:
+            list of (start token, end token, start char, end char, label, score)
+        '''
+        first, last = self.span_bounds[row], self.span_bounds[row + 1]
+        labels = [self.labels[code] for code in self.span_labels[first:last].tolist()]
+        return [(*span, label, score) for span, label, score in
+                zip(self.spans[first:last].tolist(), labels, self.span_scores[first:last].tolist())]
+
+    def row_variants(self, row, entity_sets, mode="token"):
+        '''
+        One redacted copy of the row's bio per entity set (None replaces every label)
+        Params:
+            mode: "token" (same output as `named_entity_cleaner.clean_specific_entities`) or "char"
+                  (original spacing and punctuation kept); rows that are not `aligned` fall back to "token"
+        '''
+        if mode not in ("token", "char"):
+            raise ValueError(f"Unknown substitution mode {mode!r}, expected 'token' or 'char'")
+        first, last = self.span_bounds[row], self.span_bounds[row + 1]
+        labels = [self.labels[code] for code in self.span_labels[first:last].tolist()]
+        if mode == "char" and self.aligned[row]:
+            spans = [(start, end, label) for (_, _, start, end), label in zip(self.spans[first:last].tolist(), labels)]
+            return substitute_variants(spans, entity_sets, text=self.texts[row])
+        spans = [(start, end, label) for (start, end, _, _), label in zip(self.spans[first:last].tolist(), labels)]
+        return substitute_variants(spans, entity_sets, tokens=self.row_tokens(row))
+
+    def redact(self, row, entities=None, mode="token"):
+        '''
+        Replaces every span labelled with one of `entities` (all spans if None) by its label
+        '''
+        return self.row_variants(row, [entities], mode=mode)[0]
+
+    def redact_all(self, entities=None, mode="token"):
+        '''
+        `redact` for every row, e.g. a whole `ner_no_loc_bio` column
+        '''
+        return [self.redact(row, entities, mode=mode) for row in range(len(self))]
+
+    def variants(self, entity_sets, mode="token"):
+        '''
+        Params:
+            entity_sets: {name: set of labels}, e.g. `named_entity_cleaner.entities`
+        Returns:
+            {name: list of redacted bios, one per row}; each bio is rewritten for all sets in one pass
+        '''
+        names = list(entity_sets)
+        columns = zip(*(self.row_variants(row, [entity_sets[name] for name in names], mode=mode)
+                        for row in range(len(self))))
+        out = {name: list(column) for name, column in zip(names, columns)}
+        return out if out else {name: [] for name in names}
+
+
+def build_span_store(texts, tagger, mini_batch_size=32, max_words=None):
+    '''
+    Tags each bio once (see `ner_tagging.tag_many`) and returns the `SpanStore` of the results
+    '''
+    texts = ["" if not isinstance(text, str) else text for text in texts]
+    records = ner_tagging.tag_many(texts, tagger, mini_batch_size=mini_batch_size, max_words=max_words)
+    return SpanStore.from_records(texts, records)
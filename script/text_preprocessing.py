@@ -1,19 +1,29 @@
+import functools
+import re
+import string
+from collections import OrderedDict
 from bs4 import BeautifulSoup
-import spacy
 import unidecode
 from word2number import w2n
 import contractions
+import model_loader
 '''
 Credits to: https://towardsdatascience.com/nlp-text-preprocessing-a-practical-guide-and-template-d80874676e79
 https://gist.github.com/jiahao87/d57a2535c2ed7315390920ea9296d79fte
 '''
 
-nlp = spacy.load('en_core_web_sm')
-
 # exclude words from spacy stopwords list
 deselect_stop_words = ['no', 'not']
-for w in deselect_stop_words:
-    nlp.vocab[w].is_stop = False
+
+
+def get_nlp():
+    """en_core_web_sm, loaded on first use and shared with the rest of the process"""
+    def load():
+        nlp = model_loader.get_spacy()
+        for w in deselect_stop_words:
+            nlp.vocab[w].is_stop = False
+        return nlp
+    return model_loader.load_once("text_preprocessing.nlp", load)
 
 
 def strip_html_tags(text):
@@ -41,50 +51,216 @@ def expand_contractions(text):
     return text
 
 
-def preprocess(text, accented_chars=True, contractions=True,
-               convert_num=True, extra_whitespace=True,
-               lemmatization=True, lowercase=True, punctuations=True,
-               remove_html=True, remove_num=True, special_chars=True,
-               stop_words=True):
-    """preprocess text with default option set to true for all steps"""
-    if remove_html == True:  # remove html tags
+# contractions.fix only matches whole keys, bounded by anything but these characters
+word_chars = frozenset(string.ascii_letters + string.digits + "_")
+word_after = re.compile(r"\w*", re.ASCII)
+# ascii bytes --> lowercase, with every other character turned into a space
+word_table = bytes(c if chr(c) in word_chars else ord(" ") for c in range(256)).lower()
+
+
+def ascii_words(text):
+    """e.g. "U.S. born" --> [b"u", b"s", b"born"]"""
+    return text.encode().translate(word_table).split()
+
+
+def words_around_apostrophes(text):
+    """e.g. "I'm his mother's" --> [("i", "m"), ("mother", "s")]"""
+    around = []
+    i = text.find("'")
+    while i >= 0:
+        start = i
+        while start and text[start - 1] in word_chars:
+            start -= 1
+        around.append((text[start:i].lower(), word_after.match(text, i + 1).group().lower()))
+        i = text.find("'", i + 1)
+    return around
+
+
+@functools.lru_cache(maxsize=None)
+def contraction_triggers():
+    """what contractions.fix can match in ascii text, built once from its dictionaries
+    Returns:
+        apostrophes: words around each apostrophe of the keys, e.g. ("don", "t") for don't
+        word_keys: {longest word of a key without an apostrophe: [all words of that key, ...]},
+                   e.g. b"u" --> [{b"u"}], b"jan" --> [{b"jan"}] (for "jan.")
+    """
+    keys = {**contractions.contractions_dict, **contractions.leftovers_dict, **contractions.slang_dict}
+    # keys with non ascii characters (’) can not match ascii text
+    keys = [key for key in keys if key.isascii()]
+    apostrophes = {pair for key in keys for pair in words_around_apostrophes(key)}
+    word_keys = {}
+    for key in keys:
+        if "'" not in key:
+            words = frozenset(ascii_words(key))
+            word_keys.setdefault(max(words, key=len), []).append(words)
+    return frozenset(apostrophes), word_keys
+
+
+def has_contractions(text):
+    """False only if contractions.fix cannot change the text"""
+    if not text.isascii():
+        return True
+    apostrophes, word_keys = contraction_triggers()
+    # the words on both sides of a matching key's apostrophe are exactly the words around it in the text
+    if "'" in text and not apostrophes.isdisjoint(words_around_apostrophes(text)):
+        return True
+    # and every word of a matching key without apostrophes is a whole word of the text
+    words = ascii_words(text)
+    if word_keys.keys().isdisjoint(words):
+        return False
+    words = set(words)
+    return any(key_words <= words for word in words & word_keys.keys() for key_words in word_keys[word])
+
+
+def normalize_text(text, accented_chars=True, contractions=True,
+                   extra_whitespace=True, lowercase=True, remove_html=True):
+    """string level steps of preprocess, applied before tokenisation
+    (steps that cannot change the text are skipped, the output is the same as running all of them)"""
+    # remove html tags, only possible with a tag or an entity; blank text is emptied by the whitespace step
+    if remove_html == True and ('<' in text or '&' in text or not (extra_whitespace or text.strip())):
         text = strip_html_tags(text)
     if extra_whitespace == True:  # remove extra whitespaces
-        text = remove_whitespace(text)
-    if accented_chars == True:  # remove accented characters
+        text = " ".join(text.split())
+    if accented_chars == True and not text.isascii():  # remove accented characters
         text = remove_accented_chars(text)
-    if contractions == True:  # expand contractions
+    if contractions == True and has_contractions(text):  # expand contractions
         text = expand_contractions(text)
     if lowercase == True:  # convert all characters to lowercase
         text = text.lower()
+    return text
+
+
+def decide_token(text, pos, lemma, is_stop, convert_num, lemmatization, punctuations,
+                 remove_num, special_chars, stop_words):
+    """what clean_tokens keeps of one token: its edited text, or None if it is removed"""
+    flag = True
+    edit = text
+    # remove stop words
+    if stop_words == True and is_stop and pos != 'NUM':
+        flag = False
+    # remove punctuations
+    if punctuations == True and pos == 'PUNCT' and flag == True:
+        flag = False
+    # remove special characters
+    if special_chars == True and pos == 'SYM' and flag == True:
+        flag = False
+    # remove numbers
+    if remove_num == True and (pos == 'NUM' or text.isnumeric()) \
+            and flag == True:
+        flag = False
+    # convert number words to numeric numbers
+    if convert_num == True and pos == 'NUM' and flag == True:
+        edit = w2n.word_to_num(text)
+    # convert tokens to base form
+    elif lemmatization == True and lemma != "-PRON-" and flag == True:
+        edit = lemma
+    # tokens edited and not removed
+    if edit != "" and flag == True:
+        return edit
+    return None
+
+
+# what decide_token reads of a token, as ids: text, POS, lemma and whether it is a stop word
+token_attrs = ["ORTH", "POS", "LEMMA", "IS_STOP"]
+
+
+class TokenDecisionCache:
+    """bounded LRU memo of decide_token, keyed by the token's (text, POS, lemma, stop word) ids and the flag set
+    (the same few thousand word types make up most tokens of the corpus)"""
+
+    def __init__(self, maxsize=2 ** 16):
+        self.maxsize = maxsize  # 0 turns memoization off, None makes it unbounded
+        self.decisions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clean(self, doc, flags):
+        strings = doc.vocab.strings
+        decisions = self.decisions
+        clean_text = []
+        hits = 0
+        for orth, pos, lemma, is_stop in doc.to_array(token_attrs).tolist():
+            key = (orth, pos, lemma, is_stop, flags)
+            edit = decisions.get(key, decisions)
+            if edit is decisions:
+                edit = decide_token(strings[orth], strings[pos], strings[lemma], bool(is_stop), *flags)
+                self.misses += 1
+                if self.maxsize != 0:
+                    decisions[key] = edit
+                    if self.maxsize is not None and len(decisions) > self.maxsize:
+                        decisions.popitem(last=False)
+            else:
+                decisions.move_to_end(key)
+                hits += 1
+            # append tokens edited and not removed to list
+            if edit is not None:
+                clean_text.append(edit)
+        self.hits += hits
+        return clean_text
+
+    def stats(self):
+        """hits, misses and hit rate since the cache was created"""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.decisions), "maxsize": self.maxsize}
+
+
+token_cache = TokenDecisionCache()
+
+
+def resize_token_cache(maxsize):
+    """replace the token decision cache with an empty one holding up to `maxsize` decisions"""
+    global token_cache
+    token_cache = TokenDecisionCache(maxsize)
+
+
+def token_cache_stats():
+    return token_cache.stats()
+
+
+def clean_tokens(doc, convert_num=True, lemmatization=True, punctuations=True,
+                 remove_num=True, special_chars=True, stop_words=True):
+    """token level steps of preprocess, applied to a parsed spacy Doc"""
+    flags = (convert_num, lemmatization, punctuations, remove_num, special_chars, stop_words)
+    return token_cache.clean(doc, flags)
+
+
+def preprocess(text, accented_chars=True, contractions=True,
+               convert_num=True, extra_whitespace=True,
+               lemmatization=True, lowercase=True, punctuations=True,
+               remove_html=True, remove_num=True, special_chars=True,
+               stop_words=True):
+    """preprocess text with default option set to true for all steps"""
+    text = normalize_text(text, accented_chars=accented_chars, contractions=contractions,
+                          extra_whitespace=extra_whitespace, lowercase=lowercase, remove_html=remove_html)
+
+    doc = get_nlp()(text)  # tokenise text
+
+    return clean_tokens(doc, convert_num=convert_num, lemmatization=lemmatization, punctuations=punctuations,
+                        remove_num=remove_num, special_chars=special_chars, stop_words=stop_words)
+
+
+# pipeline components preprocess never reads (it only needs POS tags, stop words and lemmas)
+unused_pipes = ['parser', 'ner']
+
 
-    doc = nlp(text)  # tokenise text
-
-    clean_text = []
-
-    for token in doc:
-        flag = True
-        edit = token.text
-        # remove stop words
-        if stop_words == True and token.is_stop and token.pos_ != 'NUM':
-            flag = False
-        # remove punctuations
-        if punctuations == True and token.pos_ == 'PUNCT' and flag == True:
-            flag = False
-        # remove special characters
-        if special_chars == True and token.pos_ == 'SYM' and flag == True:
-            flag = False
-        # remove numbers
-        if remove_num == True and (token.pos_ == 'NUM' or token.text.isnumeric()) \
-                and flag == True:
-            flag = False
-        # convert number words to numeric numbers
-        if convert_num == True and token.pos_ == 'NUM' and flag == True:
-            edit = w2n.word_to_num(token.text)
-        # convert tokens to base form
-        elif lemmatization == True and token.lemma_ != "-PRON-" and flag == True:
-            edit = token.lemma_
-        # append tokens edited and not removed to list
-        if edit != "" and flag == True:
-            clean_text.append(edit)
-    return clean_text
+def preprocess_many(texts, accented_chars=True, contractions=True,
+                    convert_num=True, extra_whitespace=True,
+                    lemmatization=True, lowercase=True, punctuations=True,
+                    remove_html=True, remove_num=True, special_chars=True,
+                    stop_words=True, batch_size=64, n_process=1, parse_store=None):
+    """preprocess for many texts at once with nlp.pipe, returns one token list per text
+    (identical to calling preprocess on each text with the same flags)
+    parse_store: optional parse_store.normalized_store, normalized texts it holds are not parsed again"""
+    normalized = (normalize_text(text, accented_chars=accented_chars, contractions=contractions,
+                                 extra_whitespace=extra_whitespace, lowercase=lowercase, remove_html=remove_html)
+                  for text in texts)
+    if parse_store is not None:
+        docs = parse_store.parse_many(normalized, batch_size=batch_size, n_process=n_process)
+    else:
+        nlp = get_nlp()
+        disable = [pipe for pipe in unused_pipes if pipe in nlp.pipe_names]
+        docs = nlp.pipe(normalized, batch_size=batch_size, n_process=n_process, disable=disable)
+    return [clean_tokens(doc, convert_num=convert_num, lemmatization=lemmatization, punctuations=punctuations,
+                         remove_num=remove_num, special_chars=special_chars, stop_words=stop_words)
+            for doc in docs]
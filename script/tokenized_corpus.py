@@ -0,0 +1,179 @@
+import argparse
+import hashlib
+import json
+import os
+from itertools import islice
+import numpy as np
+import race_classifier
+
+######################################################################################
+# Pre-tokenized corpus for the DistilBERT classifier.
+#
+# `build_corpus` tokenizes a text column once and writes
+#   input_ids.int32   every bio's token ids back to back (flat int32 array)
+#   offsets.npy       row i is input_ids[offsets[i]:offsets[i + 1]]
+#   manifest.json     tokenizer version and truncation settings used
+# `TokenizedCorpus` memory-maps these files, so rows are zero-copy slices and
+# training / testing runs skip tokenization entirely (named_entity_tester scores a
+# column through its corpus when one was built for it).
+#
+# e.g. python tokenized_corpus.py build ../data/test_sample_metadata.csv mini_bio
+#      ../data/tokenized/test_sample_metadata-mini_bio
+######################################################################################
+
+IDS_FILE = "input_ids.int32"
+OFFSETS_FILE = "offsets.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+def tokenizer_signature(tokenizer, max_length, truncation, preprocess):
+    '''
+    Everything that changes the produced input_ids; not where the tokenizer was loaded from,
+    so a moved or copied model dir still matches its corpora
+    '''
+    import transformers
+    vocab = json.dumps(sorted(tokenizer.get_vocab().items()))
+    return {
+        "transformers_version": transformers.__version__,
+        "vocab_sha256": hashlib.sha256(vocab.encode("utf-8")).hexdigest(),
+        "do_lower_case": getattr(tokenizer, "do_lower_case", None),
+        "max_length": max_length,
+        "truncation": truncation,
+        "preprocess": preprocess,
+    }
+
+
+def build_corpus(texts, tokenizer, out_dir, preprocess=True, max_length=512, truncation=True,
+                 chunk_size=1000, source=""):
+    '''
+    Tokenizes `texts` chunk by chunk and appends the ids to a flat int32 file,
+    so memory stays bounded by `chunk_size` rather than corpus size
+    Params:
+        texts: Series or list of biography text (order defines row numbers)
+        out_dir: e.g. ../data/tokenized/test_sample_metadata-mini_bio
+        source: free text note stored in the manifest, e.g. "test_sample_metadata.csv:mini_bio"
+    Returns:
+        TokenizedCorpus for `out_dir`
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    offsets = [0]
+    texts = iter(texts)
+    with open(os.path.join(out_dir, IDS_FILE), "wb") as f:
+        while True:
+            chunk = list(islice(texts, chunk_size))
+            if not chunk:
+                break
+            chunk = race_classifier.prepare_texts(chunk, preprocess=preprocess)
+            for ids in tokenizer(chunk, truncation=truncation, max_length=max_length)["input_ids"]:
+                ids = np.asarray(ids, dtype=np.int32)
+                f.write(ids.tobytes())
+                offsets.append(offsets[-1] + len(ids))
+    np.save(os.path.join(out_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+    manifest = tokenizer_signature(tokenizer, max_length, truncation, preprocess)
+    manifest.update({"rows": len(offsets) - 1, "tokens": offsets[-1],
+                     "pad_token_id": tokenizer.pad_token_id, "source": source})
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return TokenizedCorpus(out_dir)
+
+
+class TokenizedCorpus:
+    def __init__(self, corpus_dir):
+        self.corpus_dir = corpus_dir
+        with open(os.path.join(corpus_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.offsets = np.load(os.path.join(corpus_dir, OFFSETS_FILE), mmap_mode="r")
+        if self.manifest["tokens"]:
+            self.input_ids = np.memmap(os.path.join(corpus_dir, IDS_FILE), dtype=np.int32, mode="r")
+        else:
+            self.input_ids = np.zeros(0, dtype=np.int32)
+        self.lengths = np.diff(self.offsets)
+        self.pad_token_id = self.manifest["pad_token_id"]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        '''
+        Token ids of row i as a read-only view into the memory-mapped file
+        '''
+        return self.input_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def check(self, tokenizer):
+        '''
+        Raises ValueError if `tokenizer` would not produce the stored ids
+        '''
+        expected = tokenizer_signature(tokenizer, self.manifest["max_length"],
+                                       self.manifest["truncation"], self.manifest["preprocess"])
+        changed = [key for key, value in expected.items() if self.manifest.get(key) != value]
+        if changed:
+            raise ValueError(f"{self.corpus_dir} was built with a different tokenizer setup: {changed}")
+
+    def padded_batches(self, batch_size, indices=None, shuffle=False, seed=42):
+        '''
+        Yields (row indices, input_ids, attention_mask) batches of similar length,
+        each padded only to its own longest row
+        Params:
+            indices: subset of rows, e.g. a cross-validation fold (all rows if not given)
+            shuffle: visit the length buckets in random order (for training)
+        '''
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        buckets = [indices[bucket] for bucket in race_classifier.length_buckets(self.lengths[indices], batch_size)]
+        if shuffle:
+            np.random.default_rng(seed).shuffle(buckets)
+        for bucket in buckets:
+            input_ids, attention_mask = race_classifier.pad_batch([self[i] for i in bucket], self.pad_token_id)
+            yield bucket, input_ids, attention_mask
+
+    def score(self, model, batch_size=32, progress=True):
+        '''
+        Returns:
+            logits: float32 array of shape (len(self), 4) without re-tokenizing anything
+        '''
+        return race_classifier.score_ids(self, model, self.pad_token_id, batch_size=batch_size,
+                                         progress=progress, lengths=self.lengths)
+
+    def tf_dataset(self, labels, batch_size, indices=None, shuffle=False, seed=42):
+        '''
+        tf.data.Dataset of ({input_ids, attention_mask}, label) batches for `model.fit`
+        Params:
+            labels: array with one label per corpus row, e.g. df["true_race_cat"].to_numpy()
+        '''
+        import tensorflow as tf
+        labels = np.asarray(labels)
+
+        def generate():
+            for bucket, input_ids, attention_mask in self.padded_batches(batch_size, indices, shuffle, seed):
+                yield {"input_ids": input_ids, "attention_mask": attention_mask}, labels[bucket]
+
+        return tf.data.Dataset.from_generator(generate, output_signature=(
+            {"input_ids": tf.TensorSpec((None, None), tf.int32),
+             "attention_mask": tf.TensorSpec((None, None), tf.int32)},
+            tf.TensorSpec((None,), tf.as_dtype(labels.dtype))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="tokenize a csv column into a memory-mapped corpus")
+    build_command.add_argument("file_path")
+    build_command.add_argument("col_name")
+    build_command.add_argument("out_dir", help="e.g. ../data/tokenized/test_sample_metadata-mini_bio")
+    build_command.add_argument("--model-dir", default="../model/distilbert", help="tokenizer to use")
+    build_command.add_argument("--no-preprocess", action="store_true", help="tokenize the column as it is")
+    build_command.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    import model_loader
+    from dataset_store import read_columns
+    tokenizer = model_loader.get_tokenizer(args.model_dir)
+    texts = read_columns(args.file_path, [args.col_name])[args.col_name].fillna("")
+    corpus = build_corpus(texts, tokenizer, args.out_dir, preprocess=not args.no_preprocess,
+                          max_length=tokenizer.model_max_length, chunk_size=args.chunk_size,
+                          source=f"{os.path.basename(args.file_path)}:{args.col_name}")
+    print(f"Tokenized {len(corpus)} rows, {corpus.manifest['tokens']} tokens into {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()